@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import resource
+from collections import Counter
+from math import log
+from multiprocessing import Pool
+from sys import argv
+from time import time
+
+import frequency
+
+
+CORPORA = ['input.txt', 'pride-and-prejudice-small.txt', 'pride-and-prejudice.txt']
+
+# Prefixes of the largest corpus, in words, that the scaling curve is fit to.
+PREFIX_WORDS = [100, 200, 400, 800, 1600]
+
+# Whole corpora longer than this are left out, the full novel taking hours.
+MAX_WORDS = 2000
+
+
+def getWords(s):
+    '''
+    Returns the words of <s> the way the machine sees them: runs of ASCII
+    letters, lowered.
+    
+    >>> getWords("Don't stop, Mr. Bingley!")
+    ['don', 't', 'stop', 'mr', 'bingley']
+    
+    '''
+    return [word.lower() for word in re.findall('[a-zA-Z]+', s)]
+
+
+def referenceTopWords(s, stop_words, n=25, layout='linear'):
+    '''
+    Returns what the machine should print for <s>, worked out with a
+    Counter: the <n> most frequent words that aren't stop words, ties
+    going to the word seen first, or in the bucketed layout to the word
+    with the first letter earliest in the alphabet, then to the one seen
+    first.
+    
+    >>> print referenceTopWords('b a, A. the c b', ['the'], n=2)
+    b - 2
+    a - 2
+    >>> print referenceTopWords('b a, A. the c b', ['the'], n=2, layout='bucketed')
+    a - 2
+    b - 2
+    
+    '''
+    words = getWords(s)
+    counts = Counter(words)
+    first_seen = []
+    for word in words:
+        if word not in first_seen:
+            first_seen.append(word)
+    if layout == 'bucketed':
+        first_seen.sort(key=lambda word: word[0])
+    return frequency.formatTopWords([(word, counts[word]) for word in first_seen], stop_words, n)
+
+
+def getPrefix(s, words):
+    '''
+    Returns <s> up to the end of its <words>th word.
+    
+    >>> getPrefix('one, two three', 2)
+    'one, two'
+    
+    '''
+    for number, match in enumerate(re.finditer('[a-zA-Z]+', s)):
+        if number + 1 == words:
+            return s[:match.end()]
+    return s
+
+
+def runCase(args):
+    '''
+    Runs one benchmark case in the worker process it's given, so peak
+    memory is the case's own, and returns its results as a dict.
+    '''
+    name, s, engine, layout, top = args
+    stop_words = frequency.readStopWords()
+    
+    epoch = time()
+    if engine == 'multitape':
+        rules = frequency.generateMultiTapeRules(stop_words, top=top)
+    else:
+        rules = frequency.generateRules(stop_words, layout=layout, top=top)
+        if engine in ('compiled', 'generated'):
+            rules = frequency.CompiledRules.compile(rules, '+')
+    rules_seconds = time() - epoch
+    
+    epoch = time()
+    if engine == 'multitape':
+        tm = frequency.MultiTapeTuringMachine(rules, start_state='start', start_tape=s, default_slot_value='+', tape_count=3)
+    else:
+        tm = frequency.ENGINES[engine](rules, start_state='scrub', start_tape=s, default_slot_value='+')
+    build_seconds = time() - epoch
+    
+    epoch = time()
+    tm.run()
+    run_seconds = time() - epoch
+    
+    printout = tm.get_whole_printout(2) if engine == 'multitape' else tm.get_whole_printout()
+    return {'name': name,
+            'bytes': len(s),
+            'words': len(getWords(s)),
+            'state': tm.state,
+            'correct': printout == referenceTopWords(s, stop_words, top, layout),
+            'rules_seconds': rules_seconds,
+            'build_seconds': build_seconds,
+            'run_seconds': run_seconds,
+            'steps': tm.steps,
+            'steps_per_second': tm.steps / run_seconds if run_seconds else None,
+            'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def getScalingExponent(results):
+    '''
+    Returns the slope of the least squares line through log(steps)
+    against log(words), or None with fewer than two sizes.
+    
+    >>> round(getScalingExponent([{'words': 10, 'steps': 300}, {'words': 20, 'steps': 1200}]), 6)
+    2.0
+    
+    '''
+    points = [(log(result['words']), log(result['steps'])) for result in results if result['words'] and result['steps']]
+    if len(set(x for x, y in points)) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in points) /
+            sum((x - mean_x) ** 2 for x, y in points))
+
+
+def benchmark(engine='compiled', layout='linear', top=25, prefix_words=PREFIX_WORDS, max_words=MAX_WORDS, verbose=False):
+    '''
+    Runs every corpus of CORPORA of at most <max_words> words, and the
+    <prefix_words> prefixes of the largest one, each in a fresh process.
+    Returns the results and the fitted scaling exponent of the prefixes
+    as a dict ready for json.
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    texts = [(name, open(os.path.join(directory, name)).read()) for name in CORPORA]
+    
+    cases = []
+    skipped = []
+    for name, s in texts:
+        if len(getWords(s)) <= max_words:
+            cases.append((name, s))
+        else:
+            skipped.append(name)
+    name, largest = max(texts, key=lambda (name, s): len(s))
+    for words in prefix_words:
+        cases.append(('{}:{}'.format(name, words), getPrefix(largest, words)))
+    
+    results = []
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        for result in pool.imap(runCase, [(name, s, engine, layout, top) for name, s in cases]):
+            if verbose:
+                print '{name:40} {words:>6} words {steps:>12} steps {run_seconds:8.2f}s {correct}'.format(**result)
+            results.append(result)
+    finally:
+        pool.terminate()
+    
+    prefixes = [result for result in results if ':' in result['name']]
+    return {'engine': engine,
+            'layout': layout,
+            'top': top,
+            'generator_version': frequency.GENERATOR_VERSION,
+            'scaling_exponent': getScalingExponent(prefixes),
+            'correct': all(result['correct'] for result in results),
+            'skipped': skipped,
+            'results': results}
+
+
+def main():
+    prefix_words = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-w') and len(arg) > 2]
+    max_words = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-x') and len(arg) > 2]
+    tops = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-n') and len(arg) > 2]
+    outputs = [arg[2:] for arg in argv[1:] if arg.startswith('-o') and len(arg) > 2]
+    if '-h' in argv:
+        print 'Usage:\n$ python benchmark.py [-r | -t | -g] [-b] [-nN] [-wWORDS ...] [-xMAX_WORDS] [-o<results.json>]'
+        return
+    
+    engine = 'multitape' if '-t' in argv else 'reference' if '-r' in argv else 'generated' if '-g' in argv else 'compiled'
+    report = benchmark(engine=engine, layout=('bucketed' if '-b' in argv else 'linear'), top=(tops[0] if tops else 25),
+                       prefix_words=(prefix_words or PREFIX_WORDS), max_words=(max_words[0] if max_words else MAX_WORDS), verbose=True)
+    path = outputs[0] if outputs else 'benchmark.json'
+    open(path, 'w').write(json.dumps(report, indent=2, sort_keys=True))
+    print 'Scaling exponent {}, {} results written to {}.'.format(report['scaling_exponent'], 'correct' if report['correct'] else 'INCORRECT', path)
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
+    main()
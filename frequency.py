@@ -1,7 +1,67 @@
+import array
+import fnmatch
+import imp
+import json
+import marshal
+import mmap
+import os
+import re
 import string
+import zlib
+from hashlib import sha1
+from collections import OrderedDict, namedtuple
+from multiprocessing import Pool, cpu_count
 from time import time
-from sys import argv
+from sys import argv, maxint
 
+class SymbolClass(frozenset):
+    '''
+    A set of symbols that one rule reads, in place of a single symbol.
+    
+    A class rule is a fallback: a rule that reads a single symbol in the
+    same state takes precedence over it. Pair it with SAME as the write
+    value to leave each symbol as it was read.
+    
+    >>> SymbolClass('ba-')
+    [-ab]
+    
+    '''
+    def __repr__(self):
+        return '[' + ''.join(sorted(self)) + ']'
+    
+    __str__ = __repr__
+    
+    
+class Same(object):
+    '''
+    Write value that writes back whichever symbol was read. Use SAME.
+    '''
+    def __repr__(self):
+        return 'SAME'
+    
+SAME = Same()
+
+
+def expandRules(rules):
+    '''
+    Expands SymbolClass and SAME rules into plain one-symbol rules, with
+    class rules first so that later one-symbol rules override them.
+    
+    >>> expandRules([('A', SymbolClass('01'), 'A', SAME, 1), ('A', '1', 'B', '0', -1)])
+    [('A', '0', 'A', '0', 1), ('A', '1', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+    
+    '''
+    class_rules = []
+    symbol_rules = []
+    for current_state, read_value, new_state, write_value, move_dist in rules:
+        if isinstance(read_value, SymbolClass):
+            for symbol in sorted(read_value):
+                class_rules.append((current_state, symbol, new_state, symbol if write_value is SAME else write_value, move_dist))
+        else:
+            symbol_rules.append((current_state, read_value, new_state, read_value if write_value is SAME else write_value, move_dist))
+    return class_rules + symbol_rules
+    
+    
 class TuringMachine:
     '''
     A real live Turing Machine! Minus the infinate tape.
@@ -9,6 +69,10 @@ class TuringMachine:
     Creates a model of a Turing Machine with <rules>, <start_state>,
     <start_index>, <default_slot_value>, and <start_tape>.
     
+    The start tape is read where it lies, which can be a memory map from
+    readInput(), and only the cells changed since go in the tape dict,
+    None standing for a cell blanked out.
+    
     >>> rules = []
     
     >>>              # Curr. | Read  | New   | Write | Move  
@@ -56,27 +120,49 @@ class TuringMachine:
         self.state = start_state
         self.index = start_index
         self.default_slot_value = default_slot_value
-        self.tape = dict(enumerate(start_tape))
+        self.start_tape = start_tape
+        self.start_length = len(start_tape)
+        self.tape = {}
         
         self.rules = {}
+        self.class_rules = {}
         for current_state, read_value, new_state, write_value, move_dist in rules:
-            self.rules[(current_state, read_value)] = (new_state, write_value, move_dist)
+            if isinstance(read_value, SymbolClass):
+                self.class_rules.setdefault(current_state, []).insert(0, (read_value, new_state, write_value, move_dist))
+            else:
+                self.rules[(current_state, read_value)] = (new_state, write_value, move_dist)
             
         self.steps = 0
         self.halt = False
             
     def __getitem__(self, index):
         if index in self.tape:
-            return self.tape[index]
+            value = self.tape[index]
+            if value is None:
+                return self.default_slot_value
+            return value
+        elif 0 <= index < self.start_length:
+            return self.start_tape[index]
         else:
             return self.default_slot_value
         
     def __setitem__(self, index, value):
         if value == self.default_slot_value:
-            if index in self.tape:
+            if 0 <= index < self.start_length:
+                self.tape[index] = None
+            elif index in self.tape:
                 del(self.tape[index])
-        else:
+        elif index in self.tape or not 0 <= index < self.start_length or self.start_tape[index] != value:
             self.tape[index] = value
+            
+    def holds(self, index):
+        '''
+        Returns whether the cell at <index> is still part of the tape, that
+        is, whether it was on the start tape or written, and not blanked.
+        '''
+        if index in self.tape:
+            return self.tape[index] is not None
+        return 0 <= index < self.start_length
         
     def __repr__(self):
         s = '--- Step {} ---\n'.format(self.steps)
@@ -100,488 +186,3264 @@ class TuringMachine:
         
         self.steps += 1
         
-        sitch = (self.state, self[self.index])
+        read_value = self[self.index]
+        sitch = (self.state, read_value)
         
-        if sitch not in self.rules:
-            self.halt = True
-            return
-            
-        new_state, write_value, move_dist = self.rules[sitch]
+        if sitch in self.rules:
+            new_state, write_value, move_dist = self.rules[sitch]
+        else:
+            for symbol_class, new_state, write_value, move_dist in self.class_rules.get(self.state, ()):
+                if read_value in symbol_class:
+                    break
+            else:
+                self.halt = True
+                return
+                
+        if write_value is SAME:
+            write_value = read_value
         
         self.state = new_state
         self[self.index] = write_value
         self.index += move_dist
         
+    def run(self, max_steps=None):
+        while not self.halt:
+            if max_steps is not None:
+                if max_steps <= 0:
+                    return
+                max_steps -= 1
+            self.step()
+        
     def get_whole_printout(self):
         index = 0
         s = ''
         while True:
             index -= 1
-            if index not in self.tape:
+            if not self.holds(index):
                 index += 1
                 break
         while True:
-            if index in self.tape:
-                s += self.tape[index]
+            if self.holds(index):
+                s += self[index]
             else:
                 return s
             index += 1
             
             
-def getStopWordsRules(base_rule, stop_words, finish):
-    rules = []
-    rules.append((base_rule, '-', base_rule, '-', 1))
-    if '' in stop_words:
-        rules.append((base_rule, '#', finish, '-', 1))
-    for letter in string.ascii_lowercase:
-        word_group = [word[1:] for word in stop_words if word.startswith(letter)]
-        if len(word_group) > 0:
-            rules.append((base_rule, letter, base_rule + letter, letter, 1))
-            rules += getStopWordsRules(base_rule + letter, word_group, finish)
-        else:
-            rules.append((base_rule, letter, finish, letter, 1))
-    return rules
-
-
-def generateRules(charset, stop_words):
-    
-    #############
-    ### RULES #######################################################
-    #################################################################
-    # Curr. | Read  | New   | Write | Move  
-    # State | Value | State | Value | Dist. 
-    #-------|-------|-------|-------|-------
-
-    rules = []
+class MultiTapeTuringMachine:
+    '''
+    A Turing Machine with <tape_count> tapes, each under its own head.
     
+    Rules read and write a tuple with one symbol per tape and move every
+    head by its own distance:
     
-    ########################
-    ### \/ Word count \/
+        (state, (read, ...), new state, (write, ...), (move, ...))
     
+    Any read in the tuple can be a SymbolClass and any write SAME, tape by
+    tape. A rule with a class read is a fallback like in TuringMachine,
+    and the first tuple of symbols it resolves is remembered as a plain
+    rule. <start_tape> goes on the first tape, the others start blank.
     
-    for letter in string.ascii_lowercase + ' ':
-        rules.append(('scrub', letter, 'scrub', letter, 1))
-        rules.append(('scrub', letter.upper(), 'scrub', letter, 1))
-        
-    for char in charset.difference(string.ascii_letters + ' '):
-        rules.append(('scrub', char, 'scrub', ' ', 1))
-        
-    rules.append(('scrub', '+', 'mark_end', ' ', 1))
-    rules.append(('mark_end', '+', 'cap_mem', '$', 1))
-    rules.append(('cap_mem', '+', 'go_mark_beginning', '>', -1))
+    >>> rules = []
     
-    for skip_letter in string.ascii_lowercase + ' $':
-        rules.append(('go_mark_beginning', skip_letter, 'go_mark_beginning', skip_letter, -1))
-        
-    rules.append(('go_mark_beginning', '+', 'find_word', ' ', 1))
+    >>>              # Curr. | Read       | New   | Write       | Move  
+    >>>              # State | Values     | State | Values      | Dists.
+    >>>              #-------|------------|-------|-------------|--------
+    >>> rules.append(( 'A'   , ('1', '0') , 'A'   , (SAME, '1') , (1, 1) ))
+    >>> rules.append(( 'A'   , ('0', '0') , 'B'   , (SAME, SAME), (0, -1)))
     
-    rules.append(('find_word', ' ', 'find_word', ' ', 1))
+    >>> tm = MultiTapeTuringMachine(rules=rules, start_state='A', start_tape='111', tape_count=2)
+    >>> tm.run()
+    >>> print tm
+    --- Step 5 ---
+     0 0 0 0 0 0 1 1 1>0<0 0 0 0 0 0 0 0 0
+     0 0 0 0 0 0 0 1 1>1<0 0 0 0 0 0 0 0 0 HALT
+    State: B
+    Index: [3, 2]
     
-    for letter in string.ascii_lowercase:
-        rules.append(('find_word', letter, 'go_match_letter_' + letter, '*', 1))
+    >>> tm.get_whole_printout(1)
+    '111'
     
-    for letter in string.ascii_lowercase:
-        rules.append(('find_letter', letter, 'go_match_letter_' + letter, '*', 1))
-        
-    for match_letter in string.ascii_lowercase:
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('go_match_letter_' + match_letter, skip_letter, 'go_match_letter_' + match_letter, skip_letter, 1))
-        rules.append(('go_match_letter_' + match_letter, '[', 'match_letter_' + match_letter, '-', 1))
-        rules.append(('match_letter_' + match_letter, match_letter, 'match_success_' + match_letter, match_letter, 1))
-        rules.append(('match_success_' + match_letter, '-', 'go_replace_letter_' + match_letter, '[', -1))
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('go_replace_letter_' + match_letter, skip_letter, 'go_replace_letter_' + match_letter, skip_letter, -1))
-        rules.append(('go_replace_letter_' + match_letter, '*', 'find_letter', match_letter, 1))
+    '''
+    def __init__(self, rules, start_state, start_index=0, default_slot_value='0', start_tape=(), tape_count=2):
+        self.state = start_state
+        self.index = [start_index] * tape_count
+        self.default_slot_value = default_slot_value
+        self.tapes = [dict(enumerate(start_tape))] + [{} for tape in xrange(tape_count - 1)]
         
-        rules.append(('match_success_' + match_letter, '#', 'go_replace_letter_' + match_letter, '@', -1))
-        rules.append(('go_match_letter_' + match_letter, '@', 'match_failure_' + match_letter, '#', 1))
+        self.rules = {}
+        self.class_rules = {}
+        for current_state, read_values, new_state, write_values, move_dists in rules:
+            if any(isinstance(read_value, SymbolClass) for read_value in read_values):
+                self.class_rules.setdefault(current_state, []).insert(0, (read_values, (new_state, write_values, move_dists)))
+            else:
+                self.rules[(current_state, read_values)] = (new_state, write_values, move_dists)
+            
+        self.steps = 0
+        self.halt = False
         
-        rules.append(('go_match_letter_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
-        rules.append(('match_letter_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('new_word_' + match_letter, skip_letter, 'new_word_' + match_letter, skip_letter, -1))
-        rules.append(('new_word_' + match_letter, '*', 'new_word_reset', match_letter, -1))
+    def read(self, tape):
+        return self.tapes[tape].get(self.index[tape], self.default_slot_value)
         
-        for mismatch_letter in string.ascii_lowercase:
-            if mismatch_letter != match_letter:
-                rules.append(('match_letter_' + match_letter, mismatch_letter, 'match_failure_' + match_letter, mismatch_letter, 1))
-                
-    for match_letter in string.ascii_lowercase + ' ':
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('match_failure_' + match_letter, skip_letter, 'match_failure_' + match_letter, skip_letter, 1))
-        rules.append(('match_failure_' + match_letter, '~', 'new_match_mark_' + match_letter, '~', 1))
-        rules.append(('new_match_mark_' + match_letter, '-', 'new_match_' + match_letter, '[', -1))
-        rules.append(('new_match_mark_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('new_match_' + match_letter, skip_letter, 'new_match_' + match_letter, skip_letter, -1))
-        rules.append(('new_match_' + match_letter, '*', 'new_match_reset', match_letter, -1))
+    def write(self, tape, value):
+        if value == self.default_slot_value:
+            self.tapes[tape].pop(self.index[tape], None)
+        else:
+            self.tapes[tape][self.index[tape]] = value
         
-    for skip_letter in string.ascii_lowercase:
-        rules.append(('new_word_reset', skip_letter, 'new_word_reset', skip_letter, -1))
+    def __repr__(self):
+        s = '--- Step {} ---'.format(self.steps)
+        for tape, index in zip(self.tapes, self.index):
+            s += '\n'
+            for i in xrange(-9, 10):
+                if i == 0:
+                    s += '>'
+                elif i == 1:
+                    s += '<'
+                else:
+                    s += ' '
+                s += str(tape.get(index + i, self.default_slot_value))
+        if self.halt:
+            s += ' HALT'
+        s += '\nState: ' + str(self.state)
+        s += '\nIndex: ' + str(self.index)
+        return s
         
-    rules.append(('new_word_reset', ' ', 'new_word_copy', ' ', 1))
-    
-    for letter in string.ascii_lowercase:
-        rules.append(('new_word_copy', letter, 'go_place_' + letter, '*', 1))
+    def find_rule(self, read_values):
+        sitch = (self.state, read_values)
+        if sitch in self.rules:
+            return self.rules[sitch]
+        for symbol_classes, rule in self.class_rules.get(self.state, ()):
+            for symbol_class, read_value in zip(symbol_classes, read_values):
+                if read_value != symbol_class and not (isinstance(symbol_class, SymbolClass) and read_value in symbol_class):
+                    break
+            else:
+                self.rules[sitch] = rule
+                return rule
+        return None
         
-    for skip_letter in string.ascii_lowercase:
-        rules.append(('new_match_reset', skip_letter, 'new_match_reset', skip_letter, -1))
-    
-    rules.append(('new_match_reset', ' ', 'find_letter', ' ', 1))
+    def step(self):
+        if self.halt:
+            return
         
-    for place_letter in string.ascii_lowercase:
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('go_place_' + place_letter, skip_letter, 'go_place_' + place_letter, skip_letter, 1))
-        rules.append(('go_place_' + place_letter, '>', 'place_' + place_letter, '-', 1))
-        rules.append(('place_' + place_letter, '+', 'move_cap_' + place_letter, place_letter, 1))
-        rules.append(('move_cap_' + place_letter, '+', 'new_word_go_replace_letter_' + place_letter, '>', -1))
-        for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-            rules.append(('new_word_go_replace_letter_' + place_letter, skip_letter, 'new_word_go_replace_letter_' + place_letter, skip_letter, -1))
-        rules.append(('new_word_go_replace_letter_' + place_letter, '*', 'new_word_copy', place_letter, 1))
+        self.steps += 1
         
-    rules.append(('new_word_copy', ' ', 'go_end_new_word', '*', 1))
-    for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-        rules.append(('go_end_new_word', skip_letter, 'go_end_new_word', skip_letter, 1))
+        read_values = tuple([self.read(tape) for tape in xrange(len(self.tapes))])
+        rule = self.find_rule(read_values)
+        if rule is None:
+            self.halt = True
+            return
         
-    rules.append(('go_end_new_word', '>', 'first_zero_dash', '#', 1))
-    rules.append(('first_zero_dash', '+', 'first_zero', '-', 1))
-    rules.append(('first_zero', '+', 'second_zero_dash', '0', 1))
-    rules.append(('second_zero_dash', '+', 'second_zero', '-', 1))
-    rules.append(('second_zero', '+', 'third_zero_dash', '0', 1))
-    rules.append(('third_zero_dash', '+', 'third_zero', '-', 1))
-    rules.append(('third_zero', '+', 'one_dash', '0', 1))
-    rules.append(('one_dash', '+', 'one', '-', 1))
-    rules.append(('one', '+', 'tild', '1', 1))
-    rules.append(('tild', '+', 'new_word_cap', '~', 1))
-    rules.append(('new_word_cap', '+', 'go_reset_lookup', '>', -1))
-    
-    for skip_letter in string.ascii_lowercase + ' -#0123456789~':
-        rules.append(('go_reset_lookup', skip_letter, 'go_reset_lookup', skip_letter, -1))
+        new_state, write_values, move_dists = rule
+        self.state = new_state
+        for tape, write_value in enumerate(write_values):
+            if write_value is not SAME:
+                self.write(tape, write_value)
+            self.index[tape] += move_dists[tape]
         
-    rules.append(('go_reset_lookup', '$', 'reset_lookup', '$', 1))
-    rules.append(('reset_lookup', '-', 'go_replace_space', '[', -1))
-    
-    for skip_letter in string.ascii_lowercase + ' $':
-        rules.append(('go_replace_space', skip_letter, 'go_replace_space', skip_letter, -1))
+    def run(self, max_steps=None):
+        while not self.halt:
+            if max_steps is not None:
+                if max_steps <= 0:
+                    return
+                max_steps -= 1
+            self.step()
         
-    rules.append(('go_replace_space', '*', 'find_word', ' ', 1))
-    
-    rules.append(('find_letter', ' ', 'check_if_end_of_word', '*', 1))
-    for skip_letter in string.ascii_lowercase + ' $-#0123456789~':
-        rules.append(('check_if_end_of_word', skip_letter, 'check_if_end_of_word', skip_letter, 1))
-    
-    rules.append(('check_if_end_of_word', '[', 'match_failure_ ', '-', 1))
-    rules.append(('check_if_end_of_word', '@', 'find_tild', '#', 1))
-    
-    for skip_letter in string.ascii_lowercase + ' $-#0123456789':
-        rules.append(('find_tild', skip_letter, 'find_tild', skip_letter, 1))
-    rules.append(('find_tild', '~', 'inc_num', '~', -1))
-    
-    rules.append(('inc_num', '-', 'inc_num', '-', -1))
-    for i in xrange(9):
-        rules.append(('inc_num', str(i), 'go_reset_lookup', str(i+1), -1))
-    rules.append(('inc_num', '9', 'inc_num', '0', -1))
-    rules.append(('inc_num', '#', 'WORD_COUNT_EXCEEDED_9999', '#', -1))
-    
-    
-    ### /\ Word count /\
-    ########################
-    ### \/ Stop Words \/
+    def get_whole_printout(self, tape=0):
+        tape = self.tapes[tape]
+        index = 0
+        s = ''
+        while index - 1 in tape:
+            index -= 1
+        while index in tape:
+            s += tape[index]
+            index += 1
+        return s
+            
+            
+class CompiledRules(object):
+    '''
+    A rule list compiled to integers for CompiledTuringMachine.
     
+    States and symbols are numbered in the order they are first seen,
+    symbol 0 being the default slot value, and the rules become a dense
+    flat table: the entry at state * width + symbol is (new state * width,
+    write symbol, move), or None to halt. States that rewrite a set of
+    symbols with themselves and move the same way are listed in
+    sweep_loops as (state row, move, symbols).
     
-    rules.append(('find_word', '$', 'check_stop_word_', '$', 1))
-    rules.append(('check_stop_word_', '[', 'check_stop_word_', '-', 1))
-    rules += getStopWordsRules('check_stop_word_', stop_words, 'go_check_stop_word')
-    for skip_letter in string.ascii_lowercase + '-#0123456789':
-        rules.append(('go_check_stop_word', skip_letter, 'go_check_stop_word', skip_letter, 1))
-    rules.append(('go_check_stop_word', '~', 'check_stop_word_', '~', 1))
-    rules.append(('check_stop_word_', '>', 'place_two_four', '>', 1))
+    Build one with CompiledRules.compile(rules). dumps() and loads() turn
+    it into a marshal string and back, without redoing any of the work.
     
+    >>> compiled = CompiledRules.compile([('A', SymbolClass('01'), 'A', SAME, 1)], default_slot_value='+')
+    >>> compiled.states, compiled.symbols, compiled.sweep_loops
+    (['A'], ['+', '0', '1'], [(0, 1, [1, 2])])
+    >>> CompiledRules.loads(compiled.dumps()).table == compiled.table
+    True
     
-    ### /\ Stop Words /\
-    ########################
-    ### \/ Highest 25 \/
-    
-    
-    rules.append(('place_two_four', '+', 'place_four', '2', 1))
-    rules.append(('place_four', '+', 'make_max_register', '4', 1))
-    rules.append(('make_max_register', '+', 'max_register_first_zero_dash', '|', 1))
-    rules.append(('max_register_first_zero_dash', '+', 'max_register_first_zero', '-', 1))
-    rules.append(('max_register_first_zero', '+', 'max_register_second_zero_dash', '0', 1))
-    rules.append(('max_register_second_zero_dash', '+', 'max_register_second_zero', '-', 1))
-    rules.append(('max_register_second_zero', '+', 'max_register_third_zero_dash', '0', 1))
-    rules.append(('max_register_third_zero_dash', '+', 'max_register_third_zero', '-', 1))
-    rules.append(('max_register_third_zero', '+', 'max_register_fourth_zero_dash', '0', 1))
-    rules.append(('max_register_fourth_zero_dash', '+', 'max_register_fourth_zero', '-', 1))
-    rules.append(('max_register_fourth_zero', '+', 'cap_max_register', '0', 1))
-    rules.append(('cap_max_register', '+', 'reset_max_register', '=', -1))
-    
-    for digit in '0123456789':
-        rules.append(('reset_max_register', digit, 'reset_max_register', '0', -1))
-    rules.append(('reset_max_register', '-', 'reset_max_register', '-', -1))
-    rules.append(('reset_max_register', '[', 'reset_max_register', '[', -1))
-    rules.append(('reset_max_register', '|', 'mark_max_register', '|', 1))
-    rules.append(('mark_max_register', '-', 'reset_max_search', '[', -1))
-    rules.append(('mark_max_register', '[', 'reset_max_search', '[', -1))
-    
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('reset_max_search', skip_letter, 'reset_max_search', skip_letter, -1))
-    rules.append(('reset_max_search', '@', 'reset_max_search', '-', -1))
-    rules.append(('reset_max_search', '$', 'find_number', '$', 1))
-    for skip_letter in string.ascii_lowercase + '-0123456789~':
-        rules.append(('find_number', skip_letter, 'find_number', skip_letter, 1))
-    rules.append(('find_number', '#', 'go_find_digit', '#', 1))
-    for skip_digit in '0123456789':
-        rules.append(('go_find_digit', skip_digit, 'go_find_digit', skip_digit, 1))
-    rules.append(('go_find_digit', '-', 'find_digit', '[', 1))
-    
-    for match_digit in '0123456789':
-        rules.append(('find_digit', match_digit, 'go_match_digit_' + match_digit, match_digit, 1))
-        for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-            rules.append(('go_match_digit_' + match_digit, skip_letter, 'go_match_digit_' + match_digit, skip_letter, 1))
-        rules.append(('go_match_digit_' + match_digit, '[', 'match_digit_' + match_digit, '-', 1))
-        for register_digit in '0123456789':
-            if match_digit > register_digit:
-                rules.append(('match_digit_' + match_digit, register_digit, 'match_greater', match_digit, 1))
-            elif match_digit < register_digit:
-                rules.append(('match_digit_' + match_digit, register_digit, 'match_less', register_digit, -1))
-            else:
-                rules.append(('match_digit_' + match_digit, register_digit, 'match_equal', register_digit, 1))
+    '''
+    FORMAT = 1
+    
+    def __init__(self, states, symbols, rules):
+        '''
+        <rules> are (state, symbol, new state, write symbol, move) tuples
+        of indices into <states> and <symbols>.
+        '''
+        self.states = list(states)
+        self.state_ids = dict((state, i) for i, state in enumerate(self.states))
+        self.symbols = list(symbols)
+        self.symbol_ids = dict((symbol, i) for i, symbol in enumerate(self.symbols))
+        
+        if len(self.symbols) > 256:
+            raise Exception('{} symbols, the compiled tape holds at most 256'.format(len(self.symbols)))
+        
+        self.width = len(self.symbols)
+        self.table = [None] * (len(self.states) * self.width)
+        for current_state, read_value, new_state, write_value, move_dist in rules:
+            self.table[current_state * self.width + read_value] = (new_state * self.width, write_value, move_dist)
+        self.sweep_loops = self.find_sweep_loops()
+        
+    @classmethod
+    def compile(cls, rules, default_slot_value='0'):
+        states = []
+        state_ids = {}
+        symbols = [default_slot_value]
+        symbol_ids = {default_slot_value: 0}
+        
+        def intern(thing, things, thing_ids):
+            if thing not in thing_ids:
+                thing_ids[thing] = len(things)
+                things.append(thing)
+            return thing_ids[thing]
+        
+        compiled_rules = []
+        for current_state, read_value, new_state, write_value, move_dist in expandRules(rules):
+            compiled_rules.append((intern(current_state, states, state_ids),
+                                   intern(read_value, symbols, symbol_ids),
+                                   intern(new_state, states, state_ids),
+                                   intern(write_value, symbols, symbol_ids),
+                                   move_dist))
+        return cls(states, symbols, compiled_rules)
+        
+    def integer_rules(self):
+        for cell, rule in enumerate(self.table):
+            if rule is not None:
+                new_row, write_value, move_dist = rule
+                yield (cell // self.width, cell % self.width, new_row // self.width, write_value, move_dist)
                 
-    rules.append(('match_equal', '-', 'go_get_next_digit', '[', -1))
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('go_get_next_digit', skip_letter, 'go_get_next_digit', skip_letter, -1))
-    rules.append(('go_get_next_digit', '[', 'go_find_digit', '-', 1))
-    
-    rules.append(('match_equal', '=', 'match_less', '=', -1))
-    
-    rules.append(('match_greater', '-', 'go_find_copy_digit', '[', -1))
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('go_find_copy_digit', skip_letter, 'go_find_copy_digit', skip_letter, -1))
-    rules.append(('go_find_copy_digit', '[', 'go_copy_digit', '-', 1))
-    for skip_digit in '0123456789':
-        rules.append(('go_copy_digit', skip_digit, 'go_copy_digit', skip_digit, 1))
-    rules.append(('go_copy_digit', '-', 'copy_digit', '[', 1))
-    
-    for copy_digit in '0123456789':
-        rules.append(('copy_digit', copy_digit, 'go_place_digit_' + copy_digit, copy_digit, 1))
-        for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-            rules.append(('go_place_digit_' + copy_digit, skip_letter, 'go_place_digit_' + copy_digit, skip_letter, 1))
-        rules.append(('go_place_digit_' + copy_digit, '[', 'place_digit_' + copy_digit, '-', 1))
-        for replace_digit in '0123456789':
-            rules.append(('place_digit_' + copy_digit, replace_digit, 'match_greater', copy_digit, 1))
-            
-    rules.append(('match_greater', '=', 'copy_reset_max_register', '=', -1))
-    for skip_letter in '-0123456789':
-        rules.append(('copy_reset_max_register', skip_letter, 'copy_reset_max_register', skip_letter, -1))
-    rules.append(('copy_reset_max_register', '|', 'copy_mark_max_register', '|', 1))
-    rules.append(('copy_mark_max_register', '-', 'finish_number_copy', '[', -1))
-    
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('finish_number_copy', skip_letter, 'finish_number_copy', skip_letter, -1))
-    rules.append(('finish_number_copy', '[', 'label_highest', '-', -1))
-    
-    for skip_letter in string.ascii_lowercase + '-0123456789':
-        rules.append(('label_highest', skip_letter, 'label_highest', skip_letter, -1))
-    rules.append(('label_highest', '#', 'clear_previous_highest', '@', -1))
-    
-    for skip_letter in string.ascii_lowercase + '-#~0123456789':
-        rules.append(('clear_previous_highest', skip_letter, 'clear_previous_highest', skip_letter, -1))
-    rules.append(('clear_previous_highest', '@', 'go_to_highest', '#', 1))
-    rules.append(('clear_previous_highest', '$', 'go_to_highest', '$', 1))
-    
-    for skip_letter in string.ascii_lowercase + '-#~0123456789':
-        rules.append(('go_to_highest', skip_letter, 'go_to_highest', skip_letter, 1))
-    rules.append(('go_to_highest', '@', 'find_number', '@', 1))
-    
-    for skip_letter in '-0123456789':
-        rules.append(('match_less', skip_letter, 'match_less', skip_letter, -1))
-    rules.append(('match_less', '|', 'less_reset_max_register', '|', 1))
-    rules.append(('less_reset_max_register', '-', 'go_find_copy_number', '[', -1))
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('go_find_copy_number', skip_letter, 'go_find_copy_number', skip_letter, -1))
-    rules.append(('go_find_copy_number', '[', 'find_number', '-', 1))
-    
-    rules.append(('find_number', '>', 'go_copy_max_word', '>', 1))
-    
-    for skip_letter in string.ascii_lowercase + '-#~0123456789>|':
-        rules.append(('go_copy_max_word', skip_letter, 'go_copy_max_word', skip_letter, -1))
-    rules.append(('go_copy_max_word', '@', 'begin_copy_max_word', '@', -1))
-    
-    for skip_letter in string.ascii_lowercase + '-':
-        rules.append(('begin_copy_max_word', skip_letter, 'begin_copy_max_word', skip_letter, -1))
-    rules.append(('begin_copy_max_word', '~', 'go_copy_max_letter', '~', 1))
-    rules.append(('begin_copy_max_word', '$', 'go_copy_max_letter', '$', 1))
-    rules.append(('go_copy_max_letter', '-', 'copy_max_letter', '{', 1))
-    for skip_letter in string.ascii_lowercase:
-        rules.append(('go_copy_max_letter', skip_letter, 'go_copy_max_letter', skip_letter, 1))
-    
-    for copy_letter in string.ascii_lowercase:
-        rules.append(('copy_max_letter', copy_letter, 'go_place_max_letter_' + copy_letter, copy_letter, 1))
-        for skip_letter in string.ascii_lowercase + ' -@#~0123456789>|[=\n':
-            rules.append(('go_place_max_letter_' + copy_letter, skip_letter, 'go_place_max_letter_' + copy_letter, skip_letter, 1))
-        rules.append(('go_place_max_letter_' + copy_letter, '+', 'go_find_next_letter', copy_letter, -1))
-            
-    for skip_letter in string.ascii_lowercase + ' -@#~0123456789>|[=\n':
-        rules.append(('go_find_next_letter', skip_letter, 'go_find_next_letter', skip_letter, -1))
-    rules.append(('go_find_next_letter', '{', 'go_copy_max_letter', '-', 1))
-    
-    rules.append(('go_copy_max_letter', '@', 'place_word_number_spacer1', '@', 1))
-    
-    for skip_letter in string.ascii_lowercase + ' -@#~0123456789>|[=\n':
-        rules.append(('place_word_number_spacer1', skip_letter, 'place_word_number_spacer1', skip_letter, 1))
-    rules.append(('place_word_number_spacer1', '+', 'place_word_number_spacer2', ' ', 1))
-    rules.append(('place_word_number_spacer2', '+', 'place_word_number_spacer3', '-', 1))
-    rules.append(('place_word_number_spacer3', '+', 'go_get_max_number', ' ', -1))
-    
-    for skip_letter in string.ascii_lowercase + ' -@#~0123456789>|[=\n':
-        rules.append(('go_get_max_number', skip_letter, 'go_get_max_number', skip_letter, -1))
-        
-    rules.append(('go_get_max_number', '@', 'find_first_max_number', '@', 1))
-        
-    rules.append(('find_first_max_number', '-', 'find_first_max_number', '-', 1))
-    rules.append(('find_first_max_number', '0', 'find_first_max_number', '0', 1))
-    for digit in '123456789':
-        rules.append(('find_first_max_number', digit, 'found_first_max_number', digit, -1))
-    rules.append(('found_first_max_number', '-', 'copy_max_digit', '{', 1))
-    
-    for copy_digit in '0123456789':
-        rules.append(('copy_max_digit', copy_digit, 'go_place_max_digit_' + copy_digit, copy_digit, 1))
-        for skip_letter in string.ascii_lowercase + ' -#~0123456789>|[=\n':
-            rules.append(('go_place_max_digit_' + copy_digit, skip_letter, 'go_place_max_digit_' + copy_digit, skip_letter, 1))
-        rules.append(('go_place_max_digit_' + copy_digit, '+', 'go_find_max_digit', copy_digit, -1))
-        
-    for skip_letter in string.ascii_lowercase + ' -#~0123456789>|[=\n':
-        rules.append(('go_find_max_digit', skip_letter, 'go_find_max_digit', skip_letter, -1))
-    rules.append(('go_find_max_digit', '{', 'go_copy_max_digit', '-', 1))
-    for skip_digit in '0123456789':
-        rules.append(('go_copy_max_digit', skip_digit, 'go_copy_max_digit', skip_digit, 1))
-    rules.append(('go_copy_max_digit', '-', 'copy_max_digit', '{', 1))
-    
-    rules.append(('go_copy_max_digit', '~', 'go_place_line_break', '~', 1))
-    for skip_letter in string.ascii_lowercase + ' -#~0123456789>|[=\n':
-        rules.append(('go_place_line_break', skip_letter, 'go_place_line_break', skip_letter, 1))
-    rules.append(('go_place_line_break', '+', 'go_decrement_twenty_four', '\n', -1))
-    
-    for skip_letter in string.ascii_lowercase + ' -0123456789[=\n':
-        rules.append(('go_decrement_twenty_four', skip_letter, 'go_decrement_twenty_four', skip_letter, -1))
-    rules.append(('go_decrement_twenty_four', '|', 'decrement_twenty_four', '|', -1))
-    
-    for digit in '123456789':
-        rules.append(('decrement_twenty_four', digit, 'go_reset_max_register', str(int(digit) - 1), 1))
-    rules.append(('decrement_twenty_four', '0', 'decrement_twenty_four', '9', -1))
-    
-    for skip_letter in '-0123456789|[':
-        rules.append(('go_reset_max_register', skip_letter, 'go_reset_max_register', skip_letter, 1))
-    rules.append(('go_reset_max_register', '=', 'reset_max_register', '=', -1))
-    
-    rules.append(('go_copy_max_word', '$', 'go_mark_mass_copy_start', '$', -1))
-    rules.append(('decrement_twenty_four', '>', 'go_mark_mass_copy_start', '>', -1))
-    
-    for skip_letter in string.ascii_lowercase + '$ -~0123456789#@':
-        rules.append(('go_mark_mass_copy_start', skip_letter, 'go_mark_mass_copy_start', skip_letter, -1))
-    rules.append(('go_mark_mass_copy_start', '+', 'erase_first_space', '+', 1))
-    rules.append(('erase_first_space', ' ', 'mark_mass_copy_start', '+', 1))
-    
-    for letter in string.ascii_lowercase + '$ -~0123456789#@>|[':
-        rules.append(('mark_mass_copy_start', letter, 'go_find_mass_copy', '*', 1))
-        rules.append(('go_find_mass_copy', letter, 'go_find_mass_copy', letter, 1))
-    rules.append(('go_find_mass_copy', '=', 'go_mass_copy', '=', 1))
-    rules.append(('go_mass_copy', '=', 'go_mass_copy', '=', 1))
-    
-    for copy_letter in string.ascii_lowercase + ' -0123456789\n':
-        rules.append(('go_mass_copy', copy_letter, 'go_place_mass_letter_' + copy_letter, '=', -1))
-        for skip_letter in string.ascii_lowercase + '$ -~0123456789#@>|[=':
-            rules.append(('go_place_mass_letter_' + copy_letter, skip_letter, 'go_place_mass_letter_' + copy_letter, skip_letter, -1))
-        rules.append(('go_place_mass_letter_' + copy_letter, '*', 'mark_mass_copy_start', copy_letter, 1))
+    def named_rules(self):
+        '''
+        Returns the rules as a rule list again, the symbols that a state
+        treats alike gathered into one SymbolClass rule, with SAME for
+        symbols it leaves as they are.
         
-    rules.append(('go_mass_copy', '+', 'clear_end', '+', -1))
-    for clear_letter in string.ascii_lowercase + '$ -~0123456789#@>|[=':
-        rules.append(('clear_end', clear_letter, 'clear_end', '+', -1))
-    rules.append(('clear_end', '*', 'clear_end2', '+', -1))
-    rules.append(('clear_end2', '\n', 'find_beginning', '+', -1))
-    for skip_letter in string.ascii_lowercase + ' -0123456789\n':
-        rules.append(('find_beginning', skip_letter, 'find_beginning', skip_letter, -1))
-    rules.append(('find_beginning', '+', 'DONE', '+', 1))
-    
-    return rules
+        >>> compiled = CompiledRules.compile([('A', SymbolClass('01'), 'A', SAME, 1), ('A', '2', 'B', '0', -1)], default_slot_value='+')
+        >>> compiled.named_rules()
+        [('A', [01], 'A', SAME, 1), ('A', '2', 'B', '0', -1)]
         
-
-def parse(s, verbose=False, save_rules_to_file=False, user_stepthrough=False):
-    
-    charset = set()
-    for char in s:
-        charset.add(char)
+        '''
+        rules = []
+        for state_id, state in enumerate(self.states):
+            row = state_id * self.width
+            groups = OrderedDict()
+            for symbol in xrange(self.width):
+                rule = self.table[row + symbol]
+                if rule is not None:
+                    new_row, write_value, move_dist = rule
+                    key = (new_row // self.width, SAME if write_value == symbol else self.symbols[write_value], move_dist)
+                    groups.setdefault(key, []).append(self.symbols[symbol])
+            for (new_state, write_value, move_dist), symbols in groups.iteritems():
+                read_value = symbols[0] if len(symbols) == 1 else SymbolClass(symbols)
+                rules.append((state, read_value, self.states[new_state], write_value, move_dist))
+        return rules
+                
+    def extended(self, states=(), symbols=()):
+        '''
+        Returns these rules with any of <states> and <symbols> they don't
+        know yet added, or self if there are none.
+        '''
+        new_states = [state for state in set(states) if state not in self.state_ids]
+        new_symbols = [symbol for symbol in set(symbols) if symbol not in self.symbol_ids]
+        if not new_states and not new_symbols:
+            return self
+        return CompiledRules(self.states + new_states, self.symbols + new_symbols, self.integer_rules())
         
-    if '+' in charset:
-        raise Exception("'+' in charset")
+    def find_sweep_loops(self):
+        loops = {}
+        for cell, rule in enumerate(self.table):
+            if rule is None:
+                continue
+            row = cell - cell % self.width
+            symbol = cell - row
+            new_row, write_value, move_dist = rule
+            if new_row == row and write_value == symbol and move_dist in (1, -1):
+                loops.setdefault((row, move_dist), []).append(symbol)
+        return sorted((row, move_dist, symbols) for (row, move_dist), symbols in loops.iteritems())
         
-    stop_words = ['a', 'able', 'about', 'across', 'after', 'all', 'almost',
-                  'also', 'am', 'among', 'an', 'and', 'any', 'are', 'as',
-                  'at', 'be', 'because', 'been', 'but', 'by', 'can', 'cannot',
-                  'could', 'dear', 'did', 'do', 'does', 'either', 'else',
-                  'ever', 'every', 'for', 'from', 'get', 'got', 'had', 'has',
-                  'have', 'he', 'her', 'hers', 'him', 'his', 'how', 'however',
-                  'i', 'if', 'in', 'into', 'is', 'it', 'its', 'just', 'least',
-                  'let', 'like', 'likely', 'may', 'me', 'might', 'most',
-                  'must', 'my', 'neither', 'no', 'nor', 'not', 'of', 'off',
-                  'often', 'on', 'only', 'or', 'other', 'our', 'own', 'rather',
-                  'said', 'say', 'says', 'she', 'should', 'since', 'so',
-                  'some', 'than', 'that', 'the', 'their', 'them', 'then',
-                  'there', 'these', 'they', 'this', 'tis', 'to', 'too', 'twas',
-                  'us', 'wants', 'was', 'we', 'were', 'what', 'when', 'where',
-                  'which', 'while', 'who', 'whom', 'why', 'will', 'with',
-                  'would', 'yet', 'you', 'your']
+    def dumps(self):
+        return marshal.dumps((self.FORMAT, self.states, self.symbols, self.table, self.sweep_loops))
         
-    rules = generateRules(charset, stop_words)
-    
-    if verbose:
-        print '--------------------------\n'
-        print '{} rules generated.'.format(len(rules))
-    
-    if save_rules_to_file:
-        rules_string  = ' Current State                | Read  |: New State                    | Write | Move  \n'
-        rules_string += '------------------------------|-------|:------------------------------|-------|-------\n'
-        rules_string += '\n'.join([' {:28} | {:5} |: {:28} | {:5} | {:5} '.format(*[str(thing).replace('\n', '\\n').replace(' ', 'SPACE') for thing in rule]) for rule in rules])
-        open('rules.txt', 'w').write(rules_string)
-        if verbose:
-            print 'Rules saved to file rules.txt.'
+    @classmethod
+    def loads(cls, data):
+        version, states, symbols, table, sweep_loops = marshal.loads(data)
+        if version != cls.FORMAT:
+            raise ValueError('compiled rules format {}, expected {}'.format(version, cls.FORMAT))
+        compiled = cls.__new__(cls)
+        compiled.states = states
+        compiled.state_ids = dict((state, i) for i, state in enumerate(states))
+        compiled.symbols = symbols
+        compiled.symbol_ids = dict((symbol, i) for i, symbol in enumerate(symbols))
+        compiled.width = len(symbols)
+        compiled.table = table
+        compiled.sweep_loops = sweep_loops
+        return compiled
         
+        
+class CompiledTuringMachine(object):
+    '''
+    The same machine as TuringMachine, compiled for speed.
+    
+    The rules are compiled to a CompiledRules table indexed by state_row +
+    symbol (or can be given already compiled), and the tape is a
+    bytearray of symbol ids that grows to the left and right as the head
+    wanders off either end. The default slot value is always symbol 0,
+    so fresh tape is just zero bytes.
+    
+    Sweeps are accelerated: when a state rewrites every symbol of some
+    set S with itself and moves the same way, the head jumps straight to
+    the next cell outside S with a regex scan over the tape, and the
+    skipped cells are still counted as steps. Pass sweeps=False to step
+    through them one at a time.
+    
+    Given a MacroCache, the machine also memoizes how it passes through
+    short blocks of tape, so a repeated interaction is replayed in one go.
+    Given a Profiler, it records where its steps and time go instead, and
+    given a Tracer, every step it takes.
+    
+    Takes the same arguments as TuringMachine, and gives the same states,
+    step counts and printouts. TuringMachine stays the reference.
+    
+    >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+    >>> tm = CompiledTuringMachine(rules, start_state='A', start_tape='0001')
+    >>> tm.run()
+    >>> tm.steps, tm.state, tm.index
+    (5, 'B', 2)
+    >>> tm.get_whole_printout()
+    '111'
     
-    tm = TuringMachine(rules, start_state='scrub', start_tape=s, default_slot_value='+')
+    >>> sweep = [('A', '0', 'A', '0', 1), ('A', '1', 'A', '1', 1), ('A', '2', 'B', '2', 1)]
+    >>> tm = CompiledTuringMachine(sweep, start_state='A', start_tape='0101102')
+    >>> tm.run()
+    >>> tm.steps, tm.state, tm.index
+    (8, 'B', 7)
     
-    if user_stepthrough:
-        while True:
-            print tm
-            user_input = raw_input()
-            if user_input in ('finish', 'fin', 'f'):
-                break
-            if len(user_input) > 0:
-                for i in xrange(int(user_input)-1):
-                    tm.step()
-            tm.step()
+    '''
+    def __init__(self, rules, start_state, start_index=0, default_slot_value='0', start_tape=(), sweeps=True, macro_cache=None, profiler=None, tracer=None):
+        if not isinstance(rules, CompiledRules):
+            rules = CompiledRules.compile(rules, default_slot_value)
+        elif rules.symbols[0] != default_slot_value:
+            raise Exception('rules were compiled with default slot value {!r}'.format(rules.symbols[0]))
+        if isinstance(start_tape, mmap.mmap):
+            start_tape = start_tape[:]
+        elif not isinstance(start_tape, str):
+            start_tape = list(start_tape)
+        rules = rules.extended([start_state], start_tape)
         
-    epoch = time()
-    while not tm.halt:
-        tm.step()
-    elapsed = time() - epoch
+        self.compiled = rules
+        self.default_slot_value = default_slot_value
+        self.states = rules.states
+        self.state_ids = rules.state_ids
+        self.symbols = rules.symbols
+        self.symbol_ids = rules.symbol_ids
+        self.width = rules.width
         
-    if verbose:
-        print
-        print 'Halted after {:.2f}s on step {}.'.format(elapsed, tm.steps)
-        print 'State: {}'.format(tm.state)
-        print 'Read: {}'.format(tm[tm.index])
-        print '\nTape Printout:'
+        # The table without sweeps is kept for single steps through them.
+        self.rule_table = rules.table
+        self.table = list(rules.table)
+        self.sweeps = {}
+        if sweeps:
+            self.compile_sweeps()
+        if profiler is not None and tracer is not None:
+            raise Exception('a machine cannot be profiled and traced at once')
+        if macro_cache is not None and profiler is not None:
+            raise Exception('a machine cannot be profiled and use a macro cache at once')
+        if macro_cache is not None and tracer is not None:
+            raise Exception('a machine cannot be traced and use a macro cache at once')
+        self.macro_cache = macro_cache
+        if macro_cache is not None:
+            macro_cache.bind(rules)
+        self.profiler = profiler
+        self.tracer = tracer
         
-    return tm.get_whole_printout()
-
-
-def main():
-    if len(argv) < 2:
-        print 'Usage:\n$ python frequency.py <filename>'
+        if isinstance(start_tape, str):
+            translation = ''.join(chr(self.symbol_ids.get(chr(i), 0)) for i in xrange(256))
+            tape = bytearray(start_tape.translate(translation))
+        else:
+            tape = bytearray(self.symbol_ids[symbol] for symbol in start_tape)
+        
+        self.row = self.state_ids[start_state] * self.width
+        self.tape = tape
+        self.offset = 0
+        self.index = start_index
+        
+        self.steps = 0
+        self.halt = False
+        
+    def compile_sweeps(self):
+        '''
+        Moves the cells of every sweep loop from the rule table into
+        self.sweeps as (pattern, move) so run() can jump over them at once.
+        '''
+        for row, move_dist, symbols in self.compiled.sweep_loops:
+            pattern = self.sweep_pattern(symbols, move_dist)
+            for symbol in symbols:
+                self.table[row + symbol] = None
+                self.sweeps[row + symbol] = (pattern, move_dist)
+                
+    @staticmethod
+    def sweep_pattern(symbols, move_dist):
+        '''
+        Returns the regex that finds where a sweep over <symbols> moving
+        <move_dist> stops.
+        '''
+        symbol_class = '[^' + ''.join([re.escape(chr(symbol)) for symbol in symbols]) + ']'
+        if move_dist > 0:
+            return re.compile(symbol_class)
+        return re.compile('(?s).*' + symbol_class)
+        
+    @property
+    def state(self):
+        return self.states[self.row // self.width]
+        
+    @state.setter
+    def state(self, state):
+        self.row = self.state_ids[state] * self.width
+        
+    def grow(self, pos):
+        '''
+        Extends the tape so that buffer position <pos> is on it, and
+        returns where that position ends up afterwards.
+        '''
+        if pos < 0:
+            extra = max(len(self.tape), -pos, 64)
+            self.tape[0:0] = bytearray(extra)
+            self.offset += extra
+            return pos + extra
+        extra = max(len(self.tape), pos - len(self.tape) + 1, 64)
+        self.tape.extend(bytearray(extra))
+        return pos
+        
+    def __getitem__(self, index):
+        pos = index + self.offset
+        if 0 <= pos < len(self.tape):
+            return self.symbols[self.tape[pos]]
+        return self.default_slot_value
+        
+    def __setitem__(self, index, value):
+        pos = index + self.offset
+        if not 0 <= pos < len(self.tape):
+            pos = self.grow(pos)
+        if value not in self.symbol_ids:
+            raise Exception('{!r} is not a symbol of this machine'.format(value))
+        self.tape[pos] = self.symbol_ids[value]
+        
+    def __repr__(self):
+        s = '--- Step {} ---\n'.format(self.steps)
+        for i in xrange(-9, 10):
+            if i == 0:
+                s += '>'
+            elif i == 1:
+                s += '<'
+            else:
+                s += ' '
+            s += str(self[self.index + i])
+        if self.halt:
+            s += ' HALT'
+        s += '\nState: ' + str(self.state)
+        s += '\nIndex: ' + str(self.index)
+        return s
+        
+    def step(self):
+        self.run(1)
+        
+    def run(self, max_steps=None):
+        if self.halt:
+            return
+        
+        if max_steps is None:
+            max_steps = maxint
+        
+        if self.profiler is not None:
+            self.run_profiled(max_steps)
+            return
+        
+        if self.tracer is not None:
+            self.run_traced(max_steps)
+            return
+        
+        if self.macro_cache is not None:
+            self.run_macro(max_steps)
+            return
+        
+        table = self.table
+        sweeps = self.sweeps
+        tape = self.tape
+        size = len(tape)
+        row = self.row
+        pos = self.index + self.offset
+        if not 0 <= pos < size:
+            pos = self.grow(pos)
+            size = len(tape)
+        steps = self.steps
+        limit = steps + max_steps
+        
+        while steps < limit:
+            steps += 1
+            cell = row + tape[pos]
+            rule = table[cell]
+            if rule is None:
+                if cell not in sweeps:
+                    self.halt = True
+                    break
+                skipped, move_dist = self.sweep_length(cell, pos, limit - steps + 1)
+                steps += skipped - 1
+                pos += skipped * move_dist
+                if not 0 <= pos < size:
+                    pos = self.grow(pos)
+                    size = len(tape)
+                continue
+            row, tape[pos], move_dist = rule
+            pos += move_dist
+            if not 0 <= pos < size:
+                pos = self.grow(pos)
+                size = len(tape)
+        
+        self.row = row
+        self.index = pos - self.offset
+        self.steps = steps
+        
+    def run_macro(self, max_steps):
+        '''
+        Like run(), but outside of sweeps the machine moves a whole block
+        of tape at a time, looking up each (state, entry offset, block)
+        in self.macro_cache and only simulating the block on a miss.
+        '''
+        cache = self.macro_cache
+        width = cache.block_width
+        rule_table = self.rule_table
+        sweeps = self.sweeps
+        tape = self.tape
+        row = self.row
+        pos = self.index + self.offset
+        steps = self.steps
+        limit = steps + max_steps
+        
+        while steps < limit:
+            if not 0 <= pos < len(tape):
+                pos = self.grow(pos)
+            cell = row + tape[pos]
+            if cell in sweeps:
+                skipped, move_dist = self.sweep_length(cell, pos, limit - steps)
+                steps += skipped
+                pos += skipped * move_dist
+                continue
+                
+            start = pos - pos % width
+            if start + width > len(tape):
+                self.grow(start + width - 1)
+            key = (row, pos - start, str(tape[start:start + width]))
+            macro_step = cache.get(key)
+            if macro_step is None:
+                macro_step = self.simulate_block(row, pos - start, tape[start:start + width], limit - steps)
+                # A block left before the budget ran out is only a
+                # partial macro step, which is applied but not cached.
+                if macro_step[4] or not 0 <= macro_step[2] < width:
+                    cache.put(key, macro_step)
+                
+            new_row, block, exit_offset, taken, halt = macro_step
+            if taken > limit - steps:
+                # Not enough budget left for the whole block, so step once.
+                steps += 1
+                rule = rule_table[cell]
+                if rule is None:
+                    self.halt = True
+                    break
+                row, tape[pos], move_dist = rule
+                pos += move_dist
+                continue
+                
+            tape[start:start + width] = block
+            row = new_row
+            pos = start + exit_offset
+            steps += taken
+            if halt:
+                self.halt = True
+                break
+        
+        self.row = row
+        self.index = pos - self.offset
+        self.steps = steps
+        
+    def run_profiled(self, max_steps):
+        '''
+        Like run(), but counts the steps, visits and time of every state,
+        the cells the head travels and the cells it reaches, and adds
+        them to self.profiler. Sweeps are still jumped over, but no macro
+        cache is used.
+        '''
+        profiler = self.profiler
+        width = self.width
+        table = self.table
+        sweeps = self.sweeps
+        tape = self.tape
+        size = len(tape)
+        row = self.row
+        pos = self.index + self.offset
+        if not 0 <= pos < size:
+            pos = self.grow(pos)
+            size = len(tape)
+        offset = self.offset
+        steps = self.steps
+        limit = steps + max_steps
+        
+        counts = [0] * len(self.states)
+        visits = [0] * len(self.states)
+        seconds = [0.0] * len(self.states)
+        visits[row // width] += 1
+        travel = 0
+        lowest = highest = pos - offset
+        clock = time()
+        
+        while steps < limit:
+            steps += 1
+            cell = row + tape[pos]
+            rule = table[cell]
+            if rule is None:
+                if cell not in sweeps:
+                    counts[row // width] += 1
+                    self.halt = True
+                    break
+                skipped, move_dist = self.sweep_length(cell, pos, limit - steps + 1)
+                steps += skipped - 1
+                counts[row // width] += skipped
+                travel += skipped
+                pos += skipped * move_dist
+                new_row = row
+            else:
+                counts[row // width] += 1
+                new_row, tape[pos], move_dist = rule
+                pos += move_dist
+                travel += 1 if move_dist else 0
+            if not 0 <= pos < size:
+                pos = self.grow(pos)
+                size = len(tape)
+                offset = self.offset
+            if pos - offset < lowest:
+                lowest = pos - offset
+            elif pos - offset > highest:
+                highest = pos - offset
+            if new_row != row:
+                now = time()
+                seconds[row // width] += now - clock
+                clock = now
+                row = new_row
+                visits[row // width] += 1
+        seconds[row // width] += time() - clock
+        
+        self.row = row
+        self.index = pos - offset
+        self.steps = steps
+        profiler.add(self.states, counts, visits, seconds, travel, lowest, highest)
+        
+    def run_traced(self, max_steps):
+        '''
+        Like run(), but records the table cell of every step in
+        self.tracer, and a sweep once as its first cell and length. No
+        macro cache is used.
+        '''
+        tracer = self.tracer
+        if tracer.file is None:
+            tracer.start(self)
+        records = tracer.records
+        block = tracer.block
+        table = self.table
+        sweeps = self.sweeps
+        tape = self.tape
+        size = len(tape)
+        row = self.row
+        pos = self.index + self.offset
+        if not 0 <= pos < size:
+            pos = self.grow(pos)
+            size = len(tape)
+        steps = self.steps
+        limit = steps + max_steps
+        
+        while steps < limit:
+            steps += 1
+            cell = row + tape[pos]
+            rule = table[cell]
+            if rule is None:
+                if cell not in sweeps:
+                    records.append(cell)
+                    self.halt = True
+                    break
+                skipped, move_dist = self.sweep_length(cell, pos, limit - steps + 1)
+                records.append(-1 - cell)
+                records.append(skipped)
+                steps += skipped - 1
+                pos += skipped * move_dist
+            else:
+                records.append(cell)
+                row, tape[pos], move_dist = rule
+                pos += move_dist
+            if not 0 <= pos < size:
+                pos = self.grow(pos)
+                size = len(tape)
+            if len(records) >= block:
+                tracer.flush()
+        
+        self.row = row
+        self.index = pos - self.offset
+        self.steps = steps
+        
+    def simulate_block(self, row, pos, block, budget):
+        '''
+        Runs the machine from state <row> at offset <pos> of <block> until
+        the head leaves the block, the machine halts or <budget> steps
+        are taken, and returns the macro step (new row, new block, exit
+        offset, steps, halted).
+        '''
+        rule_table = self.rule_table
+        steps = 0
+        while 0 <= pos < len(block) and steps < budget:
+            steps += 1
+            rule = rule_table[row + block[pos]]
+            if rule is None:
+                return (row, str(block), pos, steps, True)
+            row, block[pos], move_dist = rule
+            pos += move_dist
+        return (row, str(block), pos, steps, False)
+        
+    def sweep_length(self, cell, pos, budget):
+        '''
+        Returns how many cells the sweep at table <cell> covers starting
+        from buffer position <pos>, capped at <budget>, and its direction.
+        '''
+        pattern, move_dist = self.sweeps[cell]
+        if move_dist > 0:
+            match = pattern.search(self.tape, pos)
+            end = match.start() if match else len(self.tape)
+        else:
+            match = pattern.match(self.tape, 0, pos + 1)
+            end = match.end() - 1 if match else -1
+        return min(abs(end - pos), budget), move_dist
+        
+    def dumps(self):
+        '''
+        Returns the state, head, step count and tape of the machine as a
+        marshal string for loads(), the tape as one string of symbols.
+        '''
+        translation = ''.join(self.symbols).ljust(256, self.default_slot_value)
+        return marshal.dumps((self.state, self.index, self.offset, self.steps, self.halt, str(self.tape).translate(translation)))
+        
+    def loads(self, data):
+        '''
+        Puts the machine back where dumps() found it. Every symbol on the
+        dumped tape has to be one of this machine's.
+        
+        >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+        >>> tm = CompiledTuringMachine(rules, start_state='A', start_tape='0001')
+        >>> tm.run(2)
+        >>> resumed = CompiledTuringMachine(rules, start_state='A')
+        >>> resumed.loads(tm.dumps())
+        >>> resumed.run()
+        >>> resumed.steps, resumed.state, resumed.index, resumed.get_whole_printout()
+        (5, 'B', 2, '111')
+        
+        '''
+        state, index, offset, steps, halt, tape = marshal.loads(data)
+        if set(tape).difference(self.symbol_ids):
+            raise Exception('symbols {!r} on the tape are not symbols of this machine'.format(sorted(set(tape).difference(self.symbol_ids))))
+        translation = ''.join(chr(self.symbol_ids.get(chr(i), 0)) for i in xrange(256))
+        self.tape = bytearray(tape.translate(translation))
+        self.state = state
+        self.index = index
+        self.offset = offset
+        self.steps = steps
+        self.halt = halt
+        
+    def get_whole_printout(self):
+        pos = self.offset
+        if not 0 <= pos < len(self.tape) or self.tape[pos] == 0:
+            return ''
+        start = self.tape.rfind('\0', 0, pos) + 1
+        end = self.tape.find('\0', pos)
+        if end == -1:
+            end = len(self.tape)
+        symbols = self.symbols
+        return ''.join([symbols[symbol] for symbol in self.tape[start:end]])
+            
+            
+class MacroCache:
+    '''
+    A bounded memo of macro steps for CompiledTuringMachine.
+    
+    Keys are (state row, entry offset, block contents) for blocks of
+    <block_width> cells, values are what the machine did to that block.
+    Rows and contents are ids of one rule table, so a cache is bound to
+    the rules of the first machine given it, and refuses any other.
+    When <capacity> is reached the least recently used quarter of the
+    entries is evicted in one go, which keeps hits to a dict lookup and
+    a counter bump.
+    
+    >>> cache = MacroCache(block_width=4, capacity=4)
+    >>> for key in 'abcd':
+    ...     cache.put(key, key.upper())
+    >>> cache.get('a'), cache.get('z')
+    ('A', None)
+    >>> cache.put('e', 'E')
+    >>> sorted(cache.entries), cache.hits, cache.misses, cache.evictions
+    (['a', 'c', 'd', 'e'], 1, 1, 1)
+    
+    A machine that never leaves a block still stops when told to:
+    
+    >>> rules = [('A', '0', 'B', '0', 1), ('B', '0', 'A', '0', -1)]
+    >>> tm = CompiledTuringMachine(rules, start_state='A', macro_cache=MacroCache())
+    >>> tm.run(1001)
+    >>> tm.steps, tm.state, tm.index
+    (1001, 'B', 1)
+    
+    '''
+    def __init__(self, block_width=8, capacity=1 << 16):
+        self.block_width = block_width
+        self.capacity = capacity
+        self.entries = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fingerprint = None
+        
+    def bind(self, compiled):
+        '''
+        Ties the cache to the CompiledRules <compiled>, raising if it's
+        already tied to other rules.
+        '''
+        fingerprint = sha1(compiled.dumps()).hexdigest()
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint
+        elif self.fingerprint != fingerprint:
+            raise Exception('macro cache was filled by a machine with other rules')
+            
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        entry[0] = self.clock
+        return entry[1]
+        
+    def put(self, key, value):
+        if len(self.entries) >= self.capacity:
+            by_age = sorted(self.entries, key=lambda key: self.entries[key][0])
+            for old_key in by_age[:max(1, len(by_age) // 4)]:
+                del self.entries[old_key]
+                self.evictions += 1
+        self.clock += 1
+        self.entries[key] = [self.clock, value]
+        
+    def __repr__(self):
+        total = self.hits + self.misses
+        return 'Macro cache: {} hits, {} misses ({:.1%} hit rate), {} entries, {} evictions'.format(
+            self.hits, self.misses, float(self.hits) / total if total else 0, len(self.entries), self.evictions)
+            
+            
+# Phases of the generateRules machine in order, as (phase, state prefixes),
+# ending with the final states. States matching none of the prefixes are put
+# down to the word count.
+PHASES = [('scrub', ('scrub', 'erase_stop_word', 'mark_end')),
+          ('word count', ()),
+          ('stop words', ('check_stop_word_', 'go_check_stop_word', 'go_highest')),
+          ('top-N', ('top_', 'cmp_')),
+          ('mass copy', ('go_mark_mass_copy_start', 'erase_first_space', 'mark_mass_copy_start', 'go_find_mass_copy',
+                         'go_mass_copy', 'go_place_mass_letter_', 'clear_end', 'find_beginning')),
+          ('halted', ('DONE', 'COUNTED'))]
+
+
+def getPhase(state):
+    '''
+    Returns which of PHASES <state> belongs to.
+    
+    >>> getPhase('go_match_letter_e'), getPhase('cmp_read_E'), getPhase('clear_end2'), getPhase('DONE')
+    ('word count', 'top-N', 'mass copy', 'halted')
+    
+    '''
+    for phase, prefixes in PHASES:
+        if state.startswith(prefixes):
+            return phase
+    return 'word count'
+    
+    
+class Profiler:
+    '''
+    Steps, visits and wall time per state of a CompiledTuringMachine,
+    with the cells its head travelled and the lowest and highest cells
+    it reached. Pass one to the machine to turn profiling on; without
+    one, run() takes its usual path.
+    
+    Time is taken whenever the state changes, so it includes the clock
+    itself and is best read relative to other states.
+    
+    >>> profiler = Profiler()
+    >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+    >>> tm = CompiledTuringMachine(rules, start_state='A', start_tape='0001', profiler=profiler)
+    >>> tm.run()
+    >>> [(row['state'], row['steps'], row['visits']) for row in profiler.report()]
+    [('A', 4, 1), ('B', 1, 1)]
+    >>> profiler.travel, profiler.tape_cells
+    (4, 4)
+    
+    '''
+    SORT_KEYS = ('steps', 'seconds', 'visits', 'state', 'phase')
+    HOT_STATES = 15
+    
+    def __init__(self):
+        self.steps = {}
+        self.visits = {}
+        self.seconds = {}
+        self.travel = 0
+        self.lowest = None
+        self.highest = None
+        
+    def add(self, states, counts, visits, seconds, travel, lowest, highest):
+        for state, count, visit_count, elapsed in zip(states, counts, visits, seconds):
+            if count or visit_count:
+                self.steps[state] = self.steps.get(state, 0) + count
+                self.visits[state] = self.visits.get(state, 0) + visit_count
+                self.seconds[state] = self.seconds.get(state, 0.0) + elapsed
+        self.travel += travel
+        self.lowest = lowest if self.lowest is None else min(self.lowest, lowest)
+        self.highest = highest if self.highest is None else max(self.highest, highest)
+        
+    @property
+    def tape_cells(self):
+        if self.lowest is None:
+            return 0
+        return self.highest - self.lowest + 1
+        
+    def report(self, sort='steps'):
+        '''
+        Returns a dict per state, with its phase, steps, visits and
+        seconds, sorted by <sort>: the largest first, or by name for
+        state and phase.
+        '''
+        if sort not in self.SORT_KEYS:
+            raise Exception('cannot sort by {}, only by {}'.format(sort, ', '.join(self.SORT_KEYS)))
+        rows = [OrderedDict([('state', state), ('phase', getPhase(state)), ('steps', self.steps[state]),
+                             ('visits', self.visits[state]), ('seconds', self.seconds[state])]) for state in self.steps]
+        rows.sort(key=lambda row: row['state'])
+        rows.sort(key=lambda row: row[sort], reverse=(sort not in ('state', 'phase')))
+        return rows
+        
+    def phases(self):
+        '''
+        Returns the steps, visits, seconds and number of states of every
+        phase that was run, in the order of PHASES.
+        '''
+        totals = OrderedDict()
+        for phase, prefixes in PHASES:
+            totals[phase] = OrderedDict([('steps', 0), ('visits', 0), ('seconds', 0.0), ('states', 0)])
+        for row in self.report():
+            phase = totals[row['phase']]
+            for key in ('steps', 'visits', 'seconds'):
+                phase[key] += row[key]
+            phase['states'] += 1
+        return OrderedDict((phase, total) for phase, total in totals.iteritems() if total['states'])
+        
+    def to_json(self, sort='steps'):
+        return json.dumps(OrderedDict([('steps', sum(self.steps.values())),
+                                       ('seconds', sum(self.seconds.values())),
+                                       ('travel', self.travel),
+                                       ('tape_cells', self.tape_cells),
+                                       ('phases', self.phases()),
+                                       ('states', self.report(sort))]), indent=2)
+        
+    def __repr__(self):
+        total = sum(self.steps.values()) or 1
+        s = 'Profile: {} steps, head travelled {} cells, {} cells of tape reached'.format(sum(self.steps.values()), self.travel, self.tape_cells)
+        for phase, totals in self.phases().iteritems():
+            s += '\n  {:12} {:>14} steps {:6.1%} {:9.2f}s {:5} states'.format(phase, totals['steps'], float(totals['steps']) / total, totals['seconds'], totals['states'])
+        s += '\nHottest states:'
+        for row in self.report()[:self.HOT_STATES]:
+            s += '\n  {:30} {:>14} steps {:6.1%} {:9.2f}s {:>10} visits'.format(row['state'], row['steps'], float(row['steps']) / total, row['seconds'], row['visits'])
+        return s
+        
+        
+TRACE_FORMAT = 1
+
+# Records a Tracer holds before compressing them out to its file.
+TRACE_BLOCK = 1 << 16
+
+
+class Tracer(object):
+    '''
+    Records every step a CompiledTuringMachine takes to the trace file at
+    <path>, for replay.py to replay. Pass one to the machine to turn
+    tracing on, and close() it when done.
+    
+    The file starts with the machine's compiled rules and its dumps() as
+    of the first step traced, then holds blocks of up to <block> records,
+    all of it zlib compressed. A step is recorded as the table cell it ran,
+    state row plus symbol read, and a sweep, however long, as the
+    negated cell and its length. The rules tell the rest, and the
+    compression takes care of the loops that shuttle back and forth over
+    the same cells, so the trace grows a lot slower than the steps. A
+    trace cut short is readable up to its last whole block.
+    '''
+    def __init__(self, path, block=TRACE_BLOCK):
+        self.path = path
+        self.block = block
+        self.file = None
+        self.records = []
+        
+    def start(self, tm):
+        self.file = open(self.path, 'wb')
+        marshal.dump((TRACE_FORMAT, zlib.compress(tm.compiled.dumps()), zlib.compress(tm.dumps())), self.file)
+        
+    def flush(self):
+        if self.records:
+            marshal.dump(zlib.compress(array.array('i', self.records).tostring()), self.file)
+            del self.records[:]
+            
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            
+            
+def getStopWordsRules(base_rule, stop_words, finish):
+    rules = []
+    rules.append((base_rule, '-', base_rule, '-', 1))
+    if '' in stop_words:
+        rules.append((base_rule, '#', finish, '-', 1))
+    else:
+        rules.append((base_rule, '#', finish, '#', 1))
+    # Letters that start no stop word fall through to <finish>.
+    rules.append((base_rule, SymbolClass(string.ascii_lowercase), finish, SAME, 1))
+    for letter in string.ascii_lowercase:
+        word_group = [word[1:] for word in stop_words if word.startswith(letter)]
+        if len(word_group) > 0:
+            rules.append((base_rule, letter, base_rule + letter, letter, 1))
+            rules += getStopWordsRules(base_rule + letter, word_group, finish)
+    return rules
+
+
+def getScrubStopWordsRules(stop_words, charset):
+    '''
+    Returns the rules of the scrub state that lower the letters of the
+    text and turn every other symbol of <charset> into a space, walking
+    the tree of <stop_words> along each word. A word that ends on a stop
+    word is blanked out before scrubbing goes on, and the text ends at
+    the first blank in state mark_end.
+    '''
+    rules = []
+    separators = SymbolClass(charset.difference(string.ascii_letters + '+'))
+    prefixes = set(word[:length] for word in stop_words if word.isalpha() and word.islower() for length in xrange(1, len(word) + 1))
+    
+    for current_state, prefix in [('scrub', ''), ('scrub_word', None)] + [('scrub_stop_' + prefix, prefix) for prefix in prefixes]:
+        for letter in string.ascii_lowercase:
+            if prefix is not None and prefix + letter in prefixes:
+                new_state = 'scrub_stop_' + prefix + letter
+            else:
+                new_state = 'scrub_word'
+            rules.append((current_state, SymbolClass(letter + letter.upper()), new_state, letter, 1))
+        if prefix in stop_words:
+            rules.append((current_state, separators, 'erase_stop_word', ' ', -1))
+            rules.append((current_state, '+', 'erase_stop_word', '+', -1))
+        else:
+            rules.append((current_state, separators, 'scrub', ' ', 1))
+            rules.append((current_state, '+', 'mark_end', ' ', 1))
+            
+    rules.append(('erase_stop_word', SymbolClass(string.ascii_lowercase), 'erase_stop_word', ' ', -1))
+    rules.append(('erase_stop_word', SymbolClass(' +'), 'scrub', SAME, 1))
+    return rules
+    
+    
+# Bump whenever generateRules changes what it emits, so that rules
+# compiled and cached by an older version are no longer picked up.
+GENERATOR_VERSION = 7
+
+# Every byte an input can hold, apart from '+' which marks blank tape. The
+# rules scrub all of them, so one rule set serves any input.
+INPUT_ALPHABET = frozenset(chr(i) for i in xrange(256)).difference('+')
+
+RULE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.rule_cache')
+
+
+def findConflicts(rules):
+    '''
+    Returns the rules that read the same symbol in the same state as an
+    earlier one but do something else, as ((state, symbol), earlier
+    outcome, outcome). Only the last of them ever fires. SymbolClass
+    rules are left out, as they're meant to overlap.
+    
+    >>> findConflicts([('A', '0', 'A', '1', 1), ('A', '0', 'B', '1', 1), ('A', '1', 'A', '1', 1)])
+    [(('A', '0'), ('A', '1', 1), ('B', '1', 1))]
+    
+    '''
+    outcomes = {}
+    conflicts = []
+    for current_state, read_value, new_state, write_value, move_dist in rules:
+        if isinstance(read_value, SymbolClass):
+            continue
+        outcome = (new_state, write_value, move_dist)
+        if outcomes.get((current_state, read_value), outcome) != outcome:
+            conflicts.append(((current_state, read_value), outcomes[(current_state, read_value)], outcome))
+        outcomes[(current_state, read_value)] = outcome
+    return conflicts
+    
+    
+def optimizeRules(rules, start_states, final_states=(), default_slot_value='+', input_symbols=INPUT_ALPHABET):
+    '''
+    Returns <rules> as CompiledRules that run from any of <start_states>
+    exactly as before, and a report of what was taken out.
+    
+    States the start states can't lead to are dropped, and so are the
+    rules reading a symbol that can never be on tape: one that is neither
+    the default slot value, one of <input_symbols>, nor written by a
+    rule. Then states that do the same on every symbol, and go to states
+    that do the same, are merged DFA-style into the first of them. The
+    start and <final_states> are never merged, so the state a run ends
+    in still tells DONE from COUNTED; a machine that halts anywhere else
+    may report another state of its merged group.
+    
+    >>> rules = [('A', '0', 'B', '1', 1), ('B', '0', 'C', '1', 1), ('C', '0', 'B', '1', 1), ('D', '0', 'A', '0', 1)]
+    >>> compiled, report = optimizeRules(rules, ['A'], default_slot_value='0', input_symbols='')
+    >>> compiled.states, report['unreachable_states'], report['merged_states']
+    (['A', 'B'], ['D'], [['B', 'C']])
+    
+    '''
+    report = OrderedDict()
+    if isinstance(rules, CompiledRules):
+        report['conflicts'] = []
+        compiled = rules
+    else:
+        report['conflicts'] = findConflicts(rules)
+        compiled = CompiledRules.compile(rules, default_slot_value)
+    width = compiled.width
+    table = compiled.table
+    
+    starts = [compiled.state_ids[state] for state in start_states]
+    reachable = set(starts)
+    unvisited = list(starts)
+    while unvisited:
+        row = unvisited.pop() * width
+        for rule in table[row:row + width]:
+            if rule is not None and rule[0] // width not in reachable:
+                reachable.add(rule[0] // width)
+                unvisited.append(rule[0] // width)
+    reachable = sorted(reachable)
+    
+    on_tape = set([0])
+    on_tape.update(compiled.symbol_ids[symbol] for symbol in input_symbols if symbol in compiled.symbol_ids)
+    for state_id in reachable:
+        on_tape.update(rule[1] for rule in table[state_id * width:(state_id + 1) * width] if rule is not None)
+    cases = {}
+    unreadable = 0
+    for state_id in reachable:
+        row = state_id * width
+        cases[state_id] = []
+        for symbol in xrange(width):
+            rule = table[row + symbol]
+            if rule is None:
+                continue
+            if symbol not in on_tape:
+                unreadable += 1
+                continue
+            cases[state_id].append((symbol, rule[1], rule[2], rule[0] // width))
+            
+    # Refine the blocks by what each state does and which blocks it goes
+    # to, until no block splits any further.
+    kept = set(starts).union(compiled.state_ids[state] for state in final_states if state in compiled.state_ids)
+    block = dict((state_id, state_id if state_id in kept else -1) for state_id in reachable)
+    while True:
+        signatures = {}
+        new_block = {}
+        for state_id in reachable:
+            signature = (block[state_id], tuple([(symbol, write_value, move_dist, block[new_state]) for symbol, write_value, move_dist, new_state in cases[state_id]]))
+            new_block[state_id] = signatures.setdefault(signature, len(signatures))
+        if len(signatures) == len(set(block.itervalues())):
+            break
+        block = new_block
+        
+    representative = {}
+    groups = OrderedDict()
+    for state_id in reachable:
+        representative.setdefault(block[state_id], state_id)
+        groups.setdefault(block[state_id], []).append(compiled.states[state_id])
+    kept_ids = sorted(representative.values())
+    new_ids = dict((state_id, i) for i, state_id in enumerate(kept_ids))
+    new_rules = [(new_ids[state_id], symbol, new_ids[representative[block[new_state]]], write_value, move_dist)
+                 for state_id in kept_ids for symbol, write_value, move_dist, new_state in cases[state_id]]
+    optimized = CompiledRules([compiled.states[state_id] for state_id in kept_ids], compiled.symbols, new_rules)
+    
+    report['unreachable_states'] = [state for state_id, state in enumerate(compiled.states) if state_id not in block]
+    report['unreadable_cases'] = unreadable
+    report['merged_states'] = [group for group in groups.itervalues() if len(group) > 1]
+    report['states'] = (len(compiled.states), len(optimized.states))
+    report['rules'] = (len(table) - table.count(None), len(new_rules))
+    return optimized, report
+    
+    
+def formatOptimizeReport(report):
+    return '{} of {} states kept, {} unreachable and {} merged away; {} of {} rules kept, {} reading symbols never on tape; {} conflicts.'.format(
+        report['states'][1], report['states'][0], len(report['unreachable_states']),
+        report['states'][0] - report['states'][1] - len(report['unreachable_states']),
+        report['rules'][1], report['rules'][0], report['unreadable_cases'], len(report['conflicts']))
+        
+        
+def loadRules(stop_words, charset=INPUT_ALPHABET, default_slot_value='+', cache_dir=RULE_CACHE_DIR, verbose=False, count_only=False, layout='linear', top=25, scrub_stop_words=True,
+              optimize=False):
+    '''
+    Returns generateRules(stop_words, charset, count_only, layout, top,
+    scrub_stop_words) as CompiledRules, run through optimizeRules() if
+    <optimize>.
+    
+    The compiled table is cached in <cache_dir> under a hash of the
+    charset, the stop words, the default slot value, count_only, layout,
+    top, scrub_stop_words, optimize, GENERATOR_VERSION and the
+    CompiledRules format, so a later call with the same inputs just
+    unmarshals it, and anything that would change the rules misses the
+    cache instead of loading a stale table.
+    '''
+    key = repr((GENERATOR_VERSION, CompiledRules.FORMAT, sorted(charset), list(stop_words), default_slot_value, count_only, layout, top, scrub_stop_words, optimize))
+    path = os.path.join(cache_dir, sha1(key).hexdigest() + '.rules')
+    
+    if os.path.exists(path):
+        try:
+            compiled = CompiledRules.loads(open(path, 'rb').read())
+        except (EOFError, ValueError, TypeError):
+            pass
+        else:
+            if verbose:
+                print 'Compiled rules loaded from {}.'.format(path)
+            return compiled
+        
+    rules = generateRules(stop_words, charset, count_only, layout, top, scrub_stop_words)
+    if optimize:
+        compiled, report = optimizeRules(rules, ['scrub'], ['DONE', 'COUNTED'], default_slot_value, charset)
+        if verbose:
+            print 'Rules optimized: {}'.format(formatOptimizeReport(report))
+    else:
+        compiled = CompiledRules.compile(rules, default_slot_value)
+    
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    open(temp_path, 'wb').write(compiled.dumps())
+    os.rename(temp_path, path)
+    if verbose:
+        print 'Rules compiled and cached to {}.'.format(path)
+    return compiled
+    
+    
+def saveRules(rules, filename='rules.txt'):
+    '''
+    Writes <rules> to <filename> as a human-readable table.
+    '''
+    rules_string  = ' Current State                | Read  |: New State                    | Write | Move  \n'
+    rules_string += '------------------------------|-------|:------------------------------|-------|-------\n'
+    rules_string += '\n'.join([' {:28} | {:5} |: {:28} | {:5} | {:5} '.format(*[str(thing).replace('\n', '\\n').replace(' ', 'SPACE') for thing in rule]) for rule in rules])
+    open(filename, 'w').write(rules_string)
+
+
+# Bump whenever generateModuleSource changes.
+GENERATED_FORMAT = 1
+
+
+def generateModuleSource(compiled):
+    '''
+    Returns the source of a Python module that runs the <compiled> rules,
+    with one function per state, for GeneratedTuringMachine.
+    
+    Each function is called as (tape, pos, steps, limit, size) and runs
+    its state until the state changes, the head leaves the tape, or
+    <limit> steps are taken, returning (state, pos, steps). A state that
+    halts comes back as -1 - state. Transitions from a state back to
+    itself loop inside its function, and the rest of the rules of a state
+    are tested inline, or looked up in a tuple for states with many.
+    
+    Sweeps find where they end by translating the tape a window at a
+    time, swept symbols to 0 and the rest to 1, and looking for a 1,
+    which is several times quicker than a regex over the same cells.
+    '''
+    width = compiled.width
+    sweeps = dict(((row, move_dist), symbols) for row, move_dist, symbols in compiled.sweep_loops)
+    header = ['# Generated by frequency.py from the rules of {} states and {} symbols. Do not edit.'.format(len(compiled.states), width),
+              '',
+              '',
+              'def sweep_right(tape, pos, size, stops):',
+              '    window = 64',
+              '    while True:',
+              '        found = tape[pos:pos + window].translate(stops).find(\'\\1\')',
+              '        if found >= 0:',
+              '            return pos + found',
+              '        pos += window',
+              '        if pos >= size:',
+              '            return size',
+              '        window *= 4',
+              '',
+              '',
+              'def sweep_left(tape, pos, stops):',
+              '    window = 64',
+              '    while True:',
+              '        start = max(pos + 1 - window, 0)',
+              '        found = tape[start:pos + 1].translate(stops).rfind(\'\\1\')',
+              '        if found >= 0:',
+              '            return start + found',
+              '        if start == 0:',
+              '            return -1',
+              '        pos = start - 1',
+              '        window *= 4',
+              '',
+              '']
+    constants = []
+    lines = []
+    
+    def bounds_check(move_dist):
+        if move_dist > 0:
+            return 'pos >= size'
+        if move_dist < 0:
+            return 'pos < 0'
+        return 'False'
+    
+    for state_id, state in enumerate(compiled.states):
+        row = state_id * width
+        lines.append('')
+        lines.append('')
+        lines.append('def state_{}(tape, pos, steps, limit, size):'.format(state_id))
+        lines.append('    # {!r}'.format(state))
+        lines.append('    while True:')
+        lines.append('        symbol = tape[pos]')
+        
+        swept = set()
+        for move_dist in (1, -1):
+            symbols = sweeps.get((row, move_dist))
+            if not symbols:
+                continue
+            swept.update(symbols)
+            name = 'SWEEP_{}_{}'.format(state_id, 'RIGHT' if move_dist > 0 else 'LEFT')
+            constants.append('{} = frozenset({!r})'.format(name, symbols))
+            constants.append('{}_STOPS = {!r}'.format(name, ''.join(['\0' if symbol in symbols else '\1' for symbol in xrange(256)])))
+            lines.append('        if symbol in {}:'.format(name))
+            if move_dist > 0:
+                lines.append('            skipped = sweep_right(tape, pos, size, {}_STOPS) - pos'.format(name))
+            else:
+                lines.append('            skipped = pos - sweep_left(tape, pos, {}_STOPS)'.format(name))
+            lines.append('            if skipped > limit - steps:')
+            lines.append('                skipped = limit - steps')
+            lines.append('            steps += skipped')
+            lines.append('            pos {} skipped'.format('+=' if move_dist > 0 else '-='))
+            lines.append('            if {} or steps >= limit:'.format(bounds_check(move_dist)))
+            lines.append('                return {}, pos, steps'.format(state_id))
+            lines.append('            continue')
+            
+        lines.append('        steps += 1')
+        groups = OrderedDict()
+        for symbol in xrange(width):
+            rule = compiled.table[row + symbol]
+            if rule is None or symbol in swept:
+                continue
+            new_row, write_value, move_dist = rule
+            key = (new_row // width, None if write_value == symbol else write_value, move_dist)
+            groups.setdefault(key, []).append(symbol)
+            
+        if len(groups) > 4:
+            table = [None] * width
+            for (new_state, write_value, move_dist), symbols in groups.iteritems():
+                for symbol in symbols:
+                    table[symbol] = (new_state, symbol if write_value is None else write_value, move_dist)
+            constants.append('TABLE_{} = {!r}'.format(state_id, tuple(table)))
+            lines.append('        rule = TABLE_{}[symbol]'.format(state_id))
+            lines.append('        if rule is None:')
+            lines.append('            return {}, pos, steps'.format(-1 - state_id))
+            lines.append('        new_state, tape[pos], move_dist = rule')
+            lines.append('        pos += move_dist')
+            lines.append('        if new_state != {} or not 0 <= pos < size or steps >= limit:'.format(state_id))
+            lines.append('            return new_state, pos, steps')
+            continue
+            
+        # Loops back into the state first, the most used rules after.
+        ordered = sorted(groups.items(), key=lambda (key, symbols): (key[0] != state_id, -len(symbols)))
+        for group, ((new_state, write_value, move_dist), symbols) in enumerate(ordered):
+            if len(symbols) == 1:
+                lines.append('        if symbol == {}:'.format(symbols[0]))
+            else:
+                constants.append('SYMBOLS_{}_{} = frozenset({!r})'.format(state_id, group, symbols))
+                lines.append('        if symbol in SYMBOLS_{}_{}:'.format(state_id, group))
+            if write_value is not None:
+                lines.append('            tape[pos] = {}'.format(write_value))
+            if move_dist:
+                lines.append('            pos += {}'.format(move_dist))
+            if new_state == state_id:
+                lines.append('            if {} or steps >= limit:'.format(bounds_check(move_dist)))
+                lines.append('                return {}, pos, steps'.format(state_id))
+                lines.append('            continue')
+            else:
+                lines.append('            return {}, pos, steps'.format(new_state))
+        lines.append('        return {}, pos, steps'.format(-1 - state_id))
+        
+    lines.append('')
+    lines.append('')
+    lines.append('STATES = [{}]'.format(', '.join('state_{}'.format(state_id) for state_id in xrange(len(compiled.states)))))
+    return '\n'.join(header + constants + lines) + '\n'
+    
+    
+def loadGeneratedModule(compiled, cache_dir=RULE_CACHE_DIR):
+    '''
+    Returns the module generateModuleSource(compiled) describes.
+    
+    Its byte code is cached in <cache_dir>, next to the compiled rules,
+    under a hash of the rule table and GENERATED_FORMAT, so a later run
+    with the same rules skips generating and compiling it. With
+    <cache_dir> None it's generated and compiled in memory.
+    '''
+    key = sha1(str(GENERATED_FORMAT))
+    key.update(compiled.dumps())
+    name = 'generated_' + key.hexdigest()
+    path = None if cache_dir is None else os.path.join(cache_dir, name + '.code')
+    
+    code = None
+    if path is not None and os.path.exists(path):
+        try:
+            code = marshal.loads(open(path, 'rb').read())
+        except (EOFError, ValueError, TypeError):
+            pass
+    if code is None:
+        code = compile(generateModuleSource(compiled), name, 'exec')
+        if path is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            open(temp_path, 'wb').write(marshal.dumps(code))
+            os.rename(temp_path, path)
+            
+    module = imp.new_module(name)
+    exec code in module.__dict__
+    return module
+    
+    
+class GeneratedTuringMachine(CompiledTuringMachine):
+    '''
+    The same machine as CompiledTuringMachine, run by Python code
+    generated from its rules by generateModuleSource(), so that each
+    state is a function with its rules inlined rather than a row of a
+    table looked up at every step.
+    
+    Takes the same arguments as CompiledTuringMachine, less the macro
+    cache and profiler, plus the <cache_dir> of loadGeneratedModule(),
+    and gives the same states, step counts and printouts.
+    
+    >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+    >>> tm = GeneratedTuringMachine(rules, start_state='A', start_tape='0001', cache_dir=None)
+    >>> tm.run()
+    >>> tm.steps, tm.state, tm.index
+    (5, 'B', 2)
+    >>> tm.get_whole_printout()
+    '111'
+    
+    '''
+    def __init__(self, rules, start_state, start_index=0, default_slot_value='0', start_tape=(), cache_dir=RULE_CACHE_DIR):
+        CompiledTuringMachine.__init__(self, rules, start_state, start_index, default_slot_value, start_tape)
+        # Python 2 clears the globals of a module once it's collected, so
+        # the module is kept along with its functions.
+        self.module = loadGeneratedModule(self.compiled, cache_dir)
+        self.functions = self.module.STATES
+        
+    def run(self, max_steps=None):
+        if self.halt:
+            return
+        
+        if max_steps is None:
+            max_steps = maxint
+        
+        functions = self.functions
+        tape = self.tape
+        size = len(tape)
+        state = self.row // self.width
+        pos = self.index + self.offset
+        if not 0 <= pos < size:
+            pos = self.grow(pos)
+            size = len(tape)
+        steps = self.steps
+        limit = steps + max_steps
+        
+        while steps < limit:
+            state, pos, steps = functions[state](tape, pos, steps, limit, size)
+            if state < 0:
+                state = -1 - state
+                self.halt = True
+                break
+            if not 0 <= pos < size:
+                pos = self.grow(pos)
+                size = len(tape)
+        
+        self.row = state * self.width
+        self.index = pos - self.offset
+        self.steps = steps
+        
+        
+ENGINES = {
+    'reference': TuringMachine,
+    'compiled': CompiledTuringMachine,
+    'generated': GeneratedTuringMachine,
+}
+
+
+def getEngineOptions(engine, rule_cache):
+    '''
+    Returns the keyword arguments ENGINES[<engine>] takes on top of the
+    common ones: the cache directory of the generated engine's code.
+    '''
+    if engine == 'generated':
+        return {'cache_dir': rule_cache}
+    return {}
+
+
+class Debugger(object):
+    '''
+    Breakpoints for a CompiledTuringMachine or GeneratedTuringMachine: on
+    entering a state whose name matches a pattern, on reading a symbol,
+    on a step and on the head entering a range of cells.
+    
+    The machine runs the table engine at full speed between breakpoints.
+    States and symbols are broken on by taking their cells out of a copy
+    of the rule table, so the machine halts there by itself. Steps are
+    run up to exactly, and the head, which moves a cell a step at most,
+    is only looked at once it could have reached a range.
+    
+    >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1), ('B', '1', 'B', '1', -1)]
+    >>> debugger = Debugger(CompiledTuringMachine(rules, start_state='A', start_tape='0001'))
+    >>> debugger.break_state('B')
+    >>> debugger.cont()
+    ['entered state B']
+    >>> debugger.tm.steps, debugger.tm.index
+    (4, 2)
+    >>> debugger.break_cells(0, 0)
+    >>> debugger.cont()
+    ['head at cell 0']
+    >>> debugger.break_step(7)
+    >>> debugger.cont()
+    ['step 7']
+    >>> debugger.window(3)
+    '0 0 0>0<1 1 1'
+    >>> debugger.cont()
+    ['halted']
+    
+    '''
+    def __init__(self, tm):
+        if not isinstance(tm, CompiledTuringMachine):
+            raise Exception('only the compiled and generated engines can be debugged')
+        if tm.macro_cache is not None or tm.profiler is not None or tm.tracer is not None:
+            raise Exception('a machine with a macro cache, profiler or tracer cannot be debugged')
+        self.tm = tm
+        self.states = []
+        self.reads = []
+        self.steps = []
+        self.regions = []
+        self.max_move = max([abs(rule[2]) for rule in tm.rule_table if rule is not None] + [1])
+        self.pending = None
+        self.table = None
+        
+    def break_state(self, pattern):
+        self.states.append(pattern)
+        self.table = None
+        
+    def break_read(self, symbol):
+        if symbol not in self.tm.symbol_ids:
+            raise Exception('{!r} is not a symbol of this machine'.format(symbol))
+        self.reads.append(symbol)
+        self.table = None
+        
+    def break_step(self, step):
+        self.steps.append(step)
+        
+    def break_cells(self, lowest, highest):
+        self.regions.append((lowest, highest))
+        
+    def clear(self):
+        self.states, self.reads, self.steps, self.regions = [], [], [], []
+        self.table = None
+        
+    def __repr__(self):
+        breakpoints = (['state {}'.format(pattern) for pattern in self.states] +
+                       ['read {!r}'.format(symbol) for symbol in self.reads] +
+                       ['step {}'.format(step) for step in self.steps] +
+                       ['cells {} to {}'.format(lowest, highest) for lowest, highest in self.regions])
+        return 'Breakpoints: {}'.format(', '.join(breakpoints) or 'none')
+        
+    def arm(self):
+        '''
+        Makes the rule table and sweeps the machine runs under while the
+        breakpoints are on.
+        '''
+        tm = self.tm
+        width = tm.width
+        rows = set(state_id * width for state_id, state in enumerate(tm.states)
+                   if any(fnmatch.fnmatchcase(state, pattern) for pattern in self.states))
+        reads = set(tm.symbol_ids[symbol] for symbol in self.reads)
+        
+        self.rows = rows
+        table = list(tm.rule_table)
+        sweeps = {}
+        if tm.sweeps:
+            for row, move_dist, symbols in tm.compiled.sweep_loops:
+                symbols = [symbol for symbol in symbols if symbol not in reads]
+                if not symbols:
+                    continue
+                pattern = tm.sweep_pattern(symbols, move_dist)
+                for symbol in symbols:
+                    table[row + symbol] = None
+                    sweeps[row + symbol] = (pattern, move_dist)
+        for cell, rule in enumerate(tm.rule_table):
+            if rule is not None and (cell % width in reads or (rule[0] in rows and cell - cell % width != rule[0])):
+                table[cell] = None
+                sweeps.pop(cell, None)
+        self.table = table
+        self.sweeps = sweeps
+        
+    def run(self, max_steps, armed):
+        tm = self.tm
+        table, sweeps = tm.table, tm.sweeps
+        if armed:
+            tm.table, tm.sweeps = self.table, self.sweeps
+        try:
+            CompiledTuringMachine.run(tm, max_steps)
+        finally:
+            tm.table, tm.sweeps = table, sweeps
+            
+    def cont(self):
+        '''
+        Runs the machine until it halts or reaches a breakpoint, and
+        returns what it stopped for.
+        '''
+        tm = self.tm
+        if self.table is None:
+            self.arm()
+        # The breakpoint last stopped at is passed over by one plain step.
+        step_over = self.pending == tm.steps
+        self.pending = None
+        
+        while not tm.halt:
+            steps = [step - tm.steps for step in self.steps if step > tm.steps]
+            inside = []
+            for lowest, highest in self.regions:
+                if lowest <= tm.index <= highest:
+                    inside.append(True)
+                    steps.append(min(tm.index - lowest, highest - tm.index) // self.max_move + 1)
+                else:
+                    inside.append(False)
+                    steps.append(max(lowest - tm.index, tm.index - highest, self.max_move) // self.max_move)
+            
+            reasons = []
+            reading = False
+            if step_over:
+                step_over = False
+                reading = True
+                row = tm.row
+                self.run(1, False)
+                if tm.row in self.rows and tm.row != row:
+                    reasons.append('entered state {}'.format(tm.state))
+            else:
+                self.run(min(steps) if steps else None, True)
+            if tm.halt and not reasons:
+                cell = tm.row + tm.tape[tm.index + tm.offset]
+                if tm.table[cell] is None and cell not in tm.sweeps:
+                    return ['halted']
+                # A breakpoint, which counted as a halting step.
+                tm.halt = False
+                tm.steps -= 1
+                if tm.symbols[cell - tm.row] in self.reads:
+                    reading = True
+                else:
+                    self.run(1, False)
+                    reasons.append('entered state {}'.format(tm.state))
+            if tm.steps in self.steps:
+                reasons.append('step {}'.format(tm.steps))
+            for (lowest, highest), was_inside in zip(self.regions, inside):
+                if not was_inside and lowest <= tm.index <= highest:
+                    reasons.append('head at cell {}'.format(tm.index))
+            if tm.halt:
+                return reasons + ['halted']
+            cell = tm.row + tm.tape[tm.index + tm.offset]
+            if (reasons or reading) and tm.symbols[cell - tm.row] in self.reads and tm.rule_table[cell] is not None:
+                self.pending = tm.steps
+                reasons.append('reading {!r} in state {}'.format(tm.symbols[cell - tm.row], tm.state))
+            if reasons:
+                return reasons
+        return ['halted']
+        
+    def step(self, steps=1):
+        '''
+        Runs <steps> steps, passing over any breakpoints.
+        '''
+        self.run(steps, False)
+        self.pending = None
+        
+    def window(self, radius=9):
+        '''
+        Returns the <radius> cells either side of the head, the head's
+        between > and <.
+        '''
+        tm = self.tm
+        pos = tm.index + tm.offset
+        cells = [tm.symbols[tm.tape[i]] if 0 <= i < len(tm.tape) else tm.default_slot_value for i in xrange(pos - radius, pos + radius + 1)]
+        cells = [str(cell).replace('\n', '\\n').replace(' ', '_') for cell in cells]
+        return ' '.join(cells[:radius]) + '>' + cells[radius] + '<' + ' '.join(cells[radius + 1:])
+
+
+def getShiftRules(base_rule, symbols, stops, width=2):
+    '''
+    Returns rules that move everything between a stop symbol and the
+    first blank <width> cells to the right, one or two, over tape made of
+    <symbols>.
+    
+    Starting in state <base_rule> anywhere right of the stop, the machine
+    goes to the blank, then works back left carrying each symbol over.
+    <stops> maps each stop symbol to the (write, finish) it ends with: at
+    the stop it writes that symbol and moves right into state finish,
+    leaving the cells it opened up holding stale copies.
+    '''
+    rules = []
+    anything = SymbolClass(symbols + '+')
+    rules.append((base_rule, SymbolClass(symbols), base_rule, SAME, 1))
+    rules.append((base_rule, '+', base_rule + '_shift', '+', -1))
+    for symbol in symbols:
+        if width == 2:
+            rules.append((base_rule + '_shift', symbol, base_rule + '_carry_' + symbol, symbol, 1))
+            rules.append((base_rule + '_carry_' + symbol, anything, base_rule + '_place_' + symbol, SAME, 1))
+            rules.append((base_rule + '_place_' + symbol, anything, base_rule + '_back_two', symbol, -1))
+        else:
+            rules.append((base_rule + '_shift', symbol, base_rule + '_place_' + symbol, symbol, 1))
+            rules.append((base_rule + '_place_' + symbol, anything, base_rule + '_back_one', symbol, -1))
+    if width == 2:
+        rules.append((base_rule + '_back_two', anything, base_rule + '_back_one', SAME, -1))
+    rules.append((base_rule + '_back_one', anything, base_rule + '_shift', SAME, -1))
+    for stop, (stop_write, finish) in stops.items():
+        rules.append((base_rule + '_shift', stop, finish, stop_write, 1))
+    return rules
+
+
+def getIncrementRules(symbols, finish):
+    '''
+    Returns rules that add one to the counter ending at the '~' left of
+    the head, starting in state inc_num, then move left into <finish>.
+    
+    A counter that carries out of its first digit gets one digit wider,
+    shifting the dictionary to its right, which is made of <symbols>.
+    
+    >>> rules = getIncrementRules(string.ascii_lowercase + '-#~0123456789[@>', 'DONE')
+    >>> tape = '$-a#-9-9-9-9~-b#-0-0-0-1~>'
+    >>> tm = CompiledTuringMachine(rules, start_state='inc_num', start_index=tape.index('~') - 1, default_slot_value='+', start_tape=tape)
+    >>> tm.run()
+    >>> tm.state, tm.get_whole_printout()
+    ('DONE', '$-a#-1-0-0-0-0~-b#-0-0-0-1~>')
+    
+    '''
+    rules = []
+    rules.append(('inc_num', '-', 'inc_num', '-', -1))
+    for i in xrange(9):
+        rules.append(('inc_num', str(i), finish, str(i+1), -1))
+    rules.append(('inc_num', '9', 'inc_num', '0', -1))
+    
+    # Every digit carried: the counter is all zeros, so make it a one and
+    # make room for another zero before the '~', which is marked '^' while
+    # the rest of the dictionary shifts right.
+    rules.append(('inc_num', '#', 'widen_counter_one', '#', 1))
+    rules.append(('widen_counter_one', '-', 'widen_counter_one', '-', 1))
+    rules.append(('widen_counter_one', '0', 'widen_counter_go_tild', '1', 1))
+    rules.append(('widen_counter_go_tild', SymbolClass('-0'), 'widen_counter_go_tild', SAME, 1))
+    rules.append(('widen_counter_go_tild', '~', 'widen_counter', '^', 1))
+    rules += getShiftRules('widen_counter', symbols, {'^': ('-', 'widen_counter_zero')})
+    rules.append(('widen_counter_zero', SymbolClass(symbols + '+'), 'widen_counter_tild', '0', 1))
+    rules.append(('widen_counter_tild', SymbolClass(symbols + '+'), finish, '~', -1))
+    return rules
+
+
+def getLinearWordCountRules(finish):
+    '''
+    Returns the word count rules for the linear layout: each new word is
+    added to the end of one list, so the dictionary keeps the words in
+    the order they were first seen. Once the text is counted, the machine
+    moves from the '$' onto the dictionary in state <finish>.
+    
+    A text put in front of a dictionary left by an earlier count, with a
+    blank in between, is counted on into that dictionary.
+    '''
+    rules = []
+    
+    rules.append(('cap_mem', '+', 'go_mark_beginning', '>', -1))
+    rules.append(('mark_end', '$', 'go_mark_beginning', '$', -1))
+    
+    rules.append(('go_mark_beginning', SymbolClass(string.ascii_lowercase + ' $'), 'go_mark_beginning', SAME, -1))
+        
+    rules.append(('go_mark_beginning', '+', 'find_word', ' ', 1))
+    
+    rules.append(('find_word', ' ', 'find_word', ' ', 1))
+    
+    for letter in string.ascii_lowercase:
+        rules.append(('find_word', letter, 'go_match_letter_' + letter, '*', 1))
+    
+    for letter in string.ascii_lowercase:
+        rules.append(('find_letter', letter, 'go_match_letter_' + letter, '*', 1))
+        
+    for match_letter in string.ascii_lowercase:
+        rules.append(('go_match_letter_' + match_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'go_match_letter_' + match_letter, SAME, 1))
+        rules.append(('go_match_letter_' + match_letter, '[', 'match_letter_' + match_letter, '-', 1))
+        rules.append(('match_letter_' + match_letter, match_letter, 'match_success_' + match_letter, match_letter, 1))
+        rules.append(('match_success_' + match_letter, '-', 'go_replace_letter_' + match_letter, '[', -1))
+        rules.append(('go_replace_letter_' + match_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'go_replace_letter_' + match_letter, SAME, -1))
+        rules.append(('go_replace_letter_' + match_letter, '*', 'find_letter', match_letter, 1))
+        
+        rules.append(('match_success_' + match_letter, '#', 'go_replace_letter_' + match_letter, '@', -1))
+        rules.append(('go_match_letter_' + match_letter, '@', 'match_failure_' + match_letter, '#', 1))
+        
+        rules.append(('go_match_letter_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
+        rules.append(('match_letter_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
+        
+        # Any other letter is a mismatch, the exact rule above takes precedence.
+        rules.append(('match_letter_' + match_letter, SymbolClass(string.ascii_lowercase), 'match_failure_' + match_letter, SAME, 1))
+                
+    for match_letter in string.ascii_lowercase + ' ':
+        rules.append(('match_failure_' + match_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'match_failure_' + match_letter, SAME, 1))
+        rules.append(('match_failure_' + match_letter, '~', 'new_match_mark_' + match_letter, '~', 1))
+        rules.append(('new_match_mark_' + match_letter, '-', 'new_match_' + match_letter, '[', -1))
+        rules.append(('new_match_mark_' + match_letter, '>', 'new_word_' + match_letter, '>', -1))
+        rules.append(('new_word_' + match_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'new_word_' + match_letter, SAME, -1))
+        rules.append(('new_word_' + match_letter, '*', 'new_word_reset', match_letter, -1))
+        rules.append(('new_match_' + match_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'new_match_' + match_letter, SAME, -1))
+        rules.append(('new_match_' + match_letter, '*', 'new_match_reset', match_letter, -1))
+        
+    rules.append(('new_word_reset', SymbolClass(string.ascii_lowercase), 'new_word_reset', SAME, -1))
+        
+    rules.append(('new_word_reset', ' ', 'new_word_copy', ' ', 1))
+    
+    for letter in string.ascii_lowercase:
+        rules.append(('new_word_copy', letter, 'go_place_' + letter, '*', 1))
+        
+    rules.append(('new_match_reset', SymbolClass(string.ascii_lowercase), 'new_match_reset', SAME, -1))
+    
+    rules.append(('new_match_reset', ' ', 'find_letter', ' ', 1))
+        
+    for place_letter in string.ascii_lowercase:
+        rules.append(('go_place_' + place_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'go_place_' + place_letter, SAME, 1))
+        rules.append(('go_place_' + place_letter, '>', 'place_' + place_letter, '-', 1))
+        rules.append(('place_' + place_letter, '+', 'move_cap_' + place_letter, place_letter, 1))
+        rules.append(('move_cap_' + place_letter, '+', 'new_word_go_replace_letter_' + place_letter, '>', -1))
+        rules.append(('new_word_go_replace_letter_' + place_letter, SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'new_word_go_replace_letter_' + place_letter, SAME, -1))
+        rules.append(('new_word_go_replace_letter_' + place_letter, '*', 'new_word_copy', place_letter, 1))
+        
+    rules.append(('new_word_copy', ' ', 'go_end_new_word', '*', 1))
+    rules.append(('go_end_new_word', SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'go_end_new_word', SAME, 1))
+        
+    rules.append(('go_end_new_word', '>', 'first_zero_dash', '#', 1))
+    rules.append(('first_zero_dash', '+', 'first_zero', '-', 1))
+    rules.append(('first_zero', '+', 'second_zero_dash', '0', 1))
+    rules.append(('second_zero_dash', '+', 'second_zero', '-', 1))
+    rules.append(('second_zero', '+', 'third_zero_dash', '0', 1))
+    rules.append(('third_zero_dash', '+', 'third_zero', '-', 1))
+    rules.append(('third_zero', '+', 'one_dash', '0', 1))
+    rules.append(('one_dash', '+', 'one', '-', 1))
+    rules.append(('one', '+', 'tild', '1', 1))
+    rules.append(('tild', '+', 'new_word_cap', '~', 1))
+    rules.append(('new_word_cap', '+', 'go_reset_lookup', '>', -1))
+    
+    rules.append(('go_reset_lookup', SymbolClass(string.ascii_lowercase + ' -#0123456789~'), 'go_reset_lookup', SAME, -1))
+        
+    rules.append(('go_reset_lookup', '$', 'reset_lookup', '$', 1))
+    rules.append(('reset_lookup', '-', 'go_replace_space', '[', -1))
+    
+    rules.append(('go_replace_space', SymbolClass(string.ascii_lowercase + ' $'), 'go_replace_space', SAME, -1))
+        
+    rules.append(('go_replace_space', '*', 'find_word', ' ', 1))
+    
+    rules.append(('find_letter', ' ', 'check_if_end_of_word', '*', 1))
+    rules.append(('check_if_end_of_word', SymbolClass(string.ascii_lowercase + ' $-#0123456789~'), 'check_if_end_of_word', SAME, 1))
+    
+    rules.append(('check_if_end_of_word', '[', 'match_failure_ ', '-', 1))
+    rules.append(('check_if_end_of_word', '@', 'find_tild', '#', 1))
+    
+    rules.append(('find_tild', SymbolClass(string.ascii_lowercase + ' $-#0123456789'), 'find_tild', SAME, 1))
+    rules.append(('find_tild', '~', 'inc_num', '~', -1))
+    
+    rules += getIncrementRules(string.ascii_lowercase + '-#~0123456789[@>', 'go_reset_lookup')
+    
+    rules.append(('find_word', '$', finish, '$', 1))
+    return rules
+
+
+LAYOUTS = ('linear', 'bucketed')
+
+
+def getBucketedWordCountRules(finish):
+    '''
+    Returns the word count rules for the bucketed layout: the dictionary
+    is split into one bucket per first letter, each headed by '!' and its
+    letter, so a lookup sweeps straight to its bucket and only goes back
+    and forth to the text for the entries in it.
+    
+    New words go at the end of their bucket, shifting the buckets after
+    it to the right. The dictionary so ends up in order of first letter,
+    then of first sighting, which decides between words of equal count.
+    Once the text is counted, the headers are turned into empty entries
+    ('~~') and the machine moves from the '$' onto the dictionary in state
+    <finish>, so it reads like a linear one.
+    
+    The text of each new word is used up while it's copied, letter by
+    letter, into room opened at the end of the bucket.
+    '''
+    rules = []
+    text = string.ascii_lowercase + ' $'
+    dictionary = string.ascii_lowercase + '-#~0123456789!>'
+    
+    rules.append(('cap_mem', '+', 'name_bucket_a', '!', 1))
+    for letter, next_letter in zip(string.ascii_lowercase, string.ascii_lowercase[1:]):
+        rules.append(('name_bucket_' + letter, '+', 'make_bucket_' + next_letter, letter, 1))
+        rules.append(('make_bucket_' + next_letter, '+', 'name_bucket_' + next_letter, '!', 1))
+    rules.append(('name_bucket_z', '+', 'cap_buckets', 'z', 1))
+    rules.append(('cap_buckets', '+', 'go_mark_beginning', '>', -1))
+    
+    rules.append(('go_mark_beginning', SymbolClass(string.ascii_lowercase + ' $!'), 'go_mark_beginning', SAME, -1))
+    rules.append(('go_mark_beginning', '+', 'find_word', ' ', 1))
+    
+    rules.append(('find_word', ' ', 'find_word', ' ', 1))
+    
+    for letter in string.ascii_lowercase:
+        rules.append(('find_word', letter, 'go_bucket_' + letter, '*', 1))
+        rules.append(('find_letter', letter, 'go_match_letter_' + letter, '*', 1))
+        
+    for match_letter in string.ascii_lowercase:
+        # Sweep past the other buckets. The first entry of a bucket is
+        # then compared like any other, its first letter matching at once.
+        rules.append(('go_bucket_' + match_letter, SymbolClass(text + dictionary.replace('!', '')), 'go_bucket_' + match_letter, SAME, 1))
+        rules.append(('go_bucket_' + match_letter, '!', 'check_bucket_' + match_letter, '!', 1))
+        rules.append(('check_bucket_' + match_letter, SymbolClass(string.ascii_lowercase), 'go_bucket_' + match_letter, SAME, 1))
+        rules.append(('check_bucket_' + match_letter, match_letter, 'enter_bucket_' + match_letter, match_letter, 1))
+        rules.append(('enter_bucket_' + match_letter, '-', 'match_letter_' + match_letter, '-', 1))
+        rules.append(('enter_bucket_' + match_letter, SymbolClass('!>'), 'new_word_' + match_letter, SAME, -1))
+        
+        rules.append(('go_match_letter_' + match_letter, SymbolClass(text + dictionary), 'go_match_letter_' + match_letter, SAME, 1))
+        rules.append(('go_match_letter_' + match_letter, '[', 'match_letter_' + match_letter, '-', 1))
+        rules.append(('go_match_letter_' + match_letter, '@', 'match_failure_' + match_letter, '#', 1))
+        rules.append(('match_letter_' + match_letter, SymbolClass(string.ascii_lowercase), 'match_failure_' + match_letter, SAME, 1))
+        rules.append(('match_letter_' + match_letter, match_letter, 'match_success_' + match_letter, match_letter, 1))
+        rules.append(('match_success_' + match_letter, '-', 'go_replace_letter_' + match_letter, '[', -1))
+        rules.append(('match_success_' + match_letter, '#', 'go_replace_letter_' + match_letter, '@', -1))
+        rules.append(('go_replace_letter_' + match_letter, SymbolClass(text + dictionary), 'go_replace_letter_' + match_letter, SAME, -1))
+        rules.append(('go_replace_letter_' + match_letter, '*', 'find_letter', match_letter, 1))
+        
+    for match_letter in string.ascii_lowercase + ' ':
+        # Running off the end of the bucket means the word is new.
+        rules.append(('match_failure_' + match_letter, SymbolClass(text + dictionary), 'match_failure_' + match_letter, SAME, 1))
+        rules.append(('match_failure_' + match_letter, '~', 'new_match_mark_' + match_letter, '~', 1))
+        rules.append(('new_match_mark_' + match_letter, '-', 'new_match_' + match_letter, '[', -1))
+        rules.append(('new_match_mark_' + match_letter, SymbolClass('!>'), 'new_word_' + match_letter, SAME, -1))
+        rules.append(('new_match_' + match_letter, SymbolClass(text + dictionary), 'new_match_' + match_letter, SAME, -1))
+        rules.append(('new_match_' + match_letter, '*', 'new_match_reset', match_letter, -1))
+        rules.append(('new_word_' + match_letter, SymbolClass(text + dictionary), 'new_word_' + match_letter, SAME, -1))
+        rules.append(('new_word_' + match_letter, '*', 'new_word_reset', match_letter, -1))
+        
+    rules.append(('new_match_reset', SymbolClass(string.ascii_lowercase), 'new_match_reset', SAME, -1))
+    rules.append(('new_match_reset', ' ', 'find_letter', ' ', 1))
+    
+    rules.append(('find_letter', ' ', 'check_if_end_of_word', '*', 1))
+    rules.append(('check_if_end_of_word', SymbolClass(text + dictionary), 'check_if_end_of_word', SAME, 1))
+    rules.append(('check_if_end_of_word', '[', 'match_failure_ ', '-', 1))
+    rules.append(('check_if_end_of_word', '@', 'find_tild', '#', 1))
+    
+    rules.append(('find_tild', SymbolClass('-0123456789'), 'find_tild', SAME, 1))
+    rules.append(('find_tild', '~', 'inc_num', '~', -1))
+    
+    rules += getIncrementRules(dictionary, 'go_next_word')
+    
+    rules.append(('go_next_word', SymbolClass(text + dictionary), 'go_next_word', SAME, -1))
+    rules.append(('go_next_word', '*', 'find_word', ' ', 1))
+    
+    # A new word: the '*' goes on the space before it, and marks from then
+    # on the last letter copied. The bucket's next header is pushed right
+    # and marked '&', and replaced with a fresh '~' to end the new entry.
+    rules.append(('new_word_reset', SymbolClass(string.ascii_lowercase), 'new_word_reset', SAME, -1))
+    rules.append(('new_word_reset', ' ', 'new_word_first', '*', 1))
+    
+    for letter in string.ascii_lowercase:
+        rules.append(('new_word_first', letter, 'go_new_bucket_' + letter, letter, 1))
+        rules.append(('go_new_bucket_' + letter, SymbolClass(text + dictionary.replace('!', '')), 'go_new_bucket_' + letter, SAME, 1))
+        rules.append(('go_new_bucket_' + letter, '!', 'check_new_bucket_' + letter, '!', 1))
+        rules.append(('check_new_bucket_' + letter, SymbolClass(string.ascii_lowercase), 'go_new_bucket_' + letter, SAME, 1))
+        rules.append(('check_new_bucket_' + letter, letter, 'go_bucket_end', letter, 1))
+        
+    rules.append(('go_bucket_end', SymbolClass(string.ascii_lowercase + '-#~0123456789'), 'go_bucket_end', SAME, 1))
+    rules.append(('go_bucket_end', SymbolClass('!>'), 'open_entry', '&', 1))
+    
+    # Room is opened at the '^' before each letter, and at the '%' after
+    # the last one for the '#-1' of a new counter.
+    rules += getShiftRules('open_entry', dictionary, {'&': ('^', 'end_entry'),
+                                                      '^': ('-', 'open_letter'),
+                                                      '%': ('#', 'place_count_dash')})
+    anything = SymbolClass(dictionary + '+')
+    rules.append(('end_entry', anything, 'move_header', '~', 1))
+    rules.append(('move_header', anything, 'check_header', SAME, 1))
+    rules.append(('check_header', SymbolClass(string.ascii_lowercase), 'place_header', SAME, -1))
+    rules.append(('check_header', '+', 'place_end', '+', -1))
+    rules.append(('place_header', anything, 'go_open_first', '!', -1))
+    rules.append(('place_end', anything, 'go_open_first', '>', -1))
+    rules.append(('go_open_first', '~', 'go_open_first', '~', -1))
+    rules.append(('go_open_first', '^', 'open_entry', '^', 1))
+    
+    rules.append(('open_letter', anything, 'move_cursor', SAME, 1))
+    rules.append(('move_cursor', anything, 'go_copy_letter', '^', -1))
+    rules.append(('go_copy_letter', SymbolClass(text + dictionary), 'go_copy_letter', SAME, -1))
+    rules.append(('go_copy_letter', '*', 'copy_letter', ' ', 1))
+    
+    for letter in string.ascii_lowercase:
+        # Look ahead for the end of the word to know what to open next.
+        rules.append(('copy_letter', letter, 'check_last_' + letter, ' ', 1))
+        rules.append(('check_last_' + letter, SymbolClass(string.ascii_lowercase), 'mark_copied_' + letter, SAME, -1))
+        rules.append(('check_last_' + letter, ' ', 'go_place_last_' + letter, '*', 1))
+        rules.append(('mark_copied_' + letter, ' ', 'go_place_' + letter, '*', 1))
+        
+        for last in ('', 'last_'):
+            rules.append(('go_place_' + last + letter, SymbolClass(text + dictionary), 'go_place_' + last + letter, SAME, 1))
+            rules.append(('go_place_' + last + letter, '^', 'place_' + last + letter, '^', -1))
+        rules.append(('place_' + letter, anything, 'open_next', letter, 1))
+        rules.append(('place_last_' + letter, anything, 'close_entry', letter, 1))
+        
+    rules.append(('open_next', '^', 'open_entry', '^', 1))
+    rules.append(('close_entry', '^', 'open_entry', '%', 1))
+    rules.append(('place_count_dash', anything, 'place_count', '-', 1))
+    rules.append(('place_count', anything, 'go_next_word', '1', -1))
+    
+    # Flatten the buckets.
+    rules.append(('find_word', '$', 'flatten_buckets', '$', 1))
+    rules.append(('flatten_buckets', SymbolClass(string.ascii_lowercase + '-#~0123456789'), 'flatten_buckets', SAME, 1))
+    rules.append(('flatten_buckets', '!', 'flatten_header', '~', 1))
+    rules.append(('flatten_header', SymbolClass(string.ascii_lowercase), 'flatten_buckets', '~', 1))
+    rules.append(('flatten_buckets', '>', 'go_flattened', '>', -1))
+    rules.append(('go_flattened', SymbolClass(string.ascii_lowercase + '-#~0123456789'), 'go_flattened', SAME, -1))
+    rules.append(('go_flattened', '$', finish, '$', 1))
+    return rules
+
+
+def generateRules(stop_words, charset=INPUT_ALPHABET, count_only=False, layout='linear', top=25, scrub_stop_words=True):
+    '''
+    Returns the rules of the word frequency machine. With <count_only> the
+    machine halts in state COUNTED right after the word count, leaving the
+    dictionary on tape for readWordCounts().
+    
+    With <scrub_stop_words> stop words are erased from the text as it is
+    scrubbed, so they are never counted. Otherwise they are counted like
+    any other word and struck from the dictionary afterwards.
+    
+    <layout> picks how the dictionary is kept while counting, one of
+    LAYOUTS. 'bucketed' only changes the order of words with equal counts,
+    see getBucketedWordCountRules(). The machine prints the <top> most
+    frequent words.
+    '''
+    if layout not in LAYOUTS:
+        raise Exception('unknown dictionary layout {!r}'.format(layout))
+    if top < 1:
+        raise Exception('top must be at least 1, not {!r}'.format(top))
+    
+    #############
+    ### RULES #######################################################
+    #################################################################
+    # Curr. | Read  | New   | Write | Move  
+    # State | Value | State | Value | Dist. 
+    #-------|-------|-------|-------|-------
+
+    rules = []
+    
+    
+    ########################
+    ### \/ Word count \/
+    
+    
+    if scrub_stop_words:
+        rules += getScrubStopWordsRules(stop_words, charset)
+    else:
+        for letter in string.ascii_lowercase + ' ':
+            rules.append(('scrub', letter, 'scrub', letter, 1))
+            rules.append(('scrub', letter.upper(), 'scrub', letter, 1))
+            
+        rules.append(('scrub', SymbolClass(charset.difference(string.ascii_letters + ' +')), 'scrub', ' ', 1))
+        
+        rules.append(('scrub', '+', 'mark_end', ' ', 1))
+    rules.append(('mark_end', '+', 'cap_mem', '$', 1))
+    
+    if count_only:
+        finish = 'COUNTED'
+    elif scrub_stop_words:
+        finish = 'go_highest'
+    else:
+        finish = 'check_stop_word_'
+    if layout == 'bucketed':
+        rules += getBucketedWordCountRules(finish)
+    else:
+        rules += getLinearWordCountRules(finish)
+        
+    if count_only:
+        return rules
+    
+    
+    ### /\ Word count /\
+    ########################
+    ### \/ Stop Words \/
+    
+    
+    rules.append(('go_highest', SymbolClass(string.ascii_lowercase + '-#~0123456789'), 'go_highest', SAME, 1))
+    rules.append(('go_highest', '[', 'go_highest', '-', 1))
+    rules.append(('go_highest', '>', 'top_place_slot_0', '>', 1))
+    
+    rules.append(('check_stop_word_', '[', 'check_stop_word_', '-', 1))
+    rules.append(('check_stop_word_', '~', 'check_stop_word_', '~', 1))
+    rules += getStopWordsRules('check_stop_word_', stop_words, 'go_check_stop_word')
+    rules.append(('go_check_stop_word', SymbolClass(string.ascii_lowercase + '-#0123456789'), 'go_check_stop_word', SAME, 1))
+    rules.append(('go_check_stop_word', '~', 'check_stop_word_', '~', 1))
+    rules.append(('check_stop_word_', '>', 'top_place_slot_0', '>', 1))
+    
+    
+    ### /\ Stop Words /\
+    ########################
+    ### \/ Highest N \/
+    
+    
+    # The top <top> words are kept in a region after the '>', in one pass
+    # over the dictionary. The region starts with one ':' per free row and
+    # ends with '|=', which reads as an empty max register. Rows are copies
+    # of dictionary entries sorted by count, smallest first, with '.' as
+    # filler wherever a row was dropped or a cursor was.
+    for slot in xrange(top):
+        rules.append(('top_place_slot_' + str(slot), '+', 'top_place_slot_' + str(slot + 1), ':', 1))
+    rules.append(('top_place_slot_' + str(top), '+', 'top_place_end', '|', 1))
+    rules.append(('top_place_end', '+', 'top_go_scan', '=', -1))
+    rules.append(('top_go_scan', SymbolClass(string.ascii_lowercase + '-#~0123456789:|>'), 'top_go_scan', SAME, -1))
+    rules.append(('top_go_scan', '$', 'top_scan', '$', 1))
+    
+    # Each counter is marked '%' and compared with the first register to
+    # its right: the smallest row while the region is full, otherwise the
+    # empty register at its end.
+    rules.append(('top_scan', SymbolClass(string.ascii_lowercase + ' -~0123456789'), 'top_scan', SAME, 1))
+    rules.append(('top_scan', '#', 'cmp_go_end', '%', 1))
+    
+    # Counters and registers can have any number of digits, so they are
+    # compared from the last digit to the first, right aligned. The result
+    # so far (Equal, Greater or Less) rides along in the state and a
+    # difference further left overrides it. Missing digits count as zeros.
+    # '[' marks the digit last visited in the counter and in the register.
+    # With no '[' in the register, the comparison starts from its end '='.
+    region = string.ascii_lowercase + '-#~0123456789>|.:'
+    rules.append(('cmp_go_end', SymbolClass('-0123456789'), 'cmp_go_end', SAME, 1))
+    rules.append(('cmp_go_end', '~', 'cmp_read_E', '~', -1))
+    
+    for result in 'EGL':
+        for match_digit in '0123456789':
+            # Look past the digit, so the counter's first digit goes over
+            # as 'last' and the register side finishes off without a return.
+            rules.append(('cmp_read_' + result, match_digit, 'cmp_peek_' + result + match_digit, match_digit, -1))
+            rules.append(('cmp_peek_' + result + match_digit, '-', 'cmp_peek_next_' + result + match_digit, '-', -1))
+            rules.append(('cmp_peek_next_' + result + match_digit, SymbolClass('0123456789'), 'cmp_mark_' + result + match_digit, SAME, 1))
+            rules.append(('cmp_peek_next_' + result + match_digit, '%', 'cmp_go_register_last_' + result + match_digit, '%', 1))
+            rules.append(('cmp_mark_' + result + match_digit, '-', 'cmp_go_register_' + result + match_digit, '[', 1))
+            
+            for last in ('', 'last_'):
+                rules.append(('cmp_go_register_' + last + result + match_digit, SymbolClass(region), 'cmp_go_register_' + last + result + match_digit, SAME, 1))
+                rules.append(('cmp_go_register_' + last + result + match_digit, '[', 'cmp_digit_' + last + result + match_digit, '-', -1))
+                rules.append(('cmp_go_register_' + last + result + match_digit, '=', 'cmp_digit_' + last + result + match_digit, '=', -1))
+                for register_digit in '0123456789':
+                    if match_digit > register_digit:
+                        new_result = 'G'
+                    elif match_digit < register_digit:
+                        new_result = 'L'
+                    else:
+                        new_result = result
+                    if last:
+                        rules.append(('cmp_digit_' + last + result + match_digit, register_digit, 'cmp_register_only_' + new_result, register_digit, -1))
+                    else:
+                        rules.append(('cmp_digit_' + last + result + match_digit, register_digit, 'cmp_mark_register_' + new_result, register_digit, -1))
+                new_result = 'G' if match_digit > '0' else result
+                if last:
+                    rules.append(('cmp_digit_' + last + result + match_digit, '|', 'cmp_back_' + new_result, '|', -1))
+                else:
+                    rules.append(('cmp_digit_' + last + result + match_digit, '|', 'cmp_go_counter_only_' + new_result, '|', -1))
+                    
+        rules.append(('cmp_mark_register_' + result, '-', 'cmp_return_' + result, '[', -1))
+        rules.append(('cmp_return_' + result, SymbolClass(region), 'cmp_return_' + result, SAME, -1))
+        rules.append(('cmp_return_' + result, '[', 'cmp_read_' + result, '-', -1))
+        
+        # The register has digits left: a nonzero one makes it the larger.
+        rules.append(('cmp_register_only_' + result, SymbolClass('-0'), 'cmp_register_only_' + result, SAME, -1))
+        rules.append(('cmp_register_only_' + result, SymbolClass('123456789'), 'cmp_register_only_L', SAME, -1))
+        rules.append(('cmp_register_only_' + result, '|', 'cmp_back_' + result, '|', -1))
+        rules.append(('cmp_back_' + result, SymbolClass(region), 'cmp_back_' + result, SAME, -1))
+        
+        # The counter has digits left: a nonzero one makes it the larger.
+        rules.append(('cmp_go_counter_only_' + result, SymbolClass(region), 'cmp_go_counter_only_' + result, SAME, -1))
+        rules.append(('cmp_go_counter_only_' + result, '[', 'cmp_counter_only_' + result, '-', -1))
+        rules.append(('cmp_counter_only_' + result, SymbolClass('-0'), 'cmp_counter_only_' + result, SAME, -1))
+        rules.append(('cmp_counter_only_' + result, SymbolClass('123456789'), 'cmp_counter_only_G', SAME, -1))
+        
+        for done in ('cmp_back_', 'cmp_counter_only_'):
+            if result == 'G':
+                rules.append((done + result, '%', 'top_greater', '%', -1))
+            else:
+                rules.append((done + result, '%', 'top_not_greater', '%', -1))
+                
+    # While a word looks for its place among the rows, the last letter
+    # before its counter is a capital. Otherwise this was the first
+    # comparison: a counter no greater than the smallest of a full region
+    # is passed over, and one that is greater takes a free row if there
+    # is one, or else drops the smallest row.
+    rules.append(('top_not_greater', SymbolClass(string.ascii_lowercase), 'top_pass_over', SAME, 1))
+    rules.append(('top_pass_over', '%', 'top_scan', '#', 1))
+    rules.append(('top_not_greater', SymbolClass(string.ascii_uppercase), 'top_go_place', SAME, 1))
+    rules.append(('top_greater', SymbolClass(string.ascii_lowercase), 'top_go_region', SAME, 1))
+    rules.append(('top_greater', SymbolClass(string.ascii_uppercase), 'top_go_next_row', SAME, 1))
+    
+    rules.append(('top_go_region', SymbolClass(string.ascii_lowercase + '-#~0123456789%'), 'top_go_region', SAME, 1))
+    rules.append(('top_go_region', '>', 'top_take_row', '>', 1))
+    rules.append(('top_take_row', '.', 'top_take_row', '.', 1))
+    rules.append(('top_take_row', ':', 'top_find_row', '.', 1))
+    rules.append(('top_take_row', '-', 'top_drop_row', '.', 1))
+    rules.append(('top_drop_row', SymbolClass(string.ascii_lowercase + '-0123456789|'), 'top_drop_row', '.', 1))
+    rules.append(('top_drop_row', '=', 'top_find_row', '.', 1))
+    
+    # The word is compared with the rows from the smallest up, each row
+    # in turn written as the register, '#' and '~' becoming '|' and '='.
+    rules.append(('top_find_row', SymbolClass('.:'), 'top_find_row', SAME, 1))
+    rules.append(('top_find_row', '-', 'top_mark_row', '-', 1))
+    rules.append(('top_find_row', '|', 'top_open_end', '_', 1))
+    rules.append(('top_mark_row', SymbolClass(string.ascii_lowercase + '-'), 'top_mark_row', SAME, 1))
+    rules.append(('top_mark_row', '#', 'top_mark_row_end', '|', 1))
+    rules.append(('top_mark_row_end', SymbolClass('-0123456789'), 'top_mark_row_end', SAME, 1))
+    rules.append(('top_mark_row_end', '~', 'top_go_compare', '=', -1))
+    rules.append(('top_go_compare', SymbolClass(region + '='), 'top_go_compare', SAME, -1))
+    rules.append(('top_go_compare', '%', 'top_capitalize', '%', -1))
+    for letter in string.ascii_lowercase:
+        rules.append(('top_capitalize', letter, 'top_compare', letter.upper(), 1))
+    rules.append(('top_capitalize', SymbolClass(string.ascii_uppercase), 'top_compare', SAME, 1))
+    rules.append(('top_compare', '%', 'cmp_go_end', '%', 1))
+    
+    rules.append(('top_go_next_row', SymbolClass(string.ascii_lowercase + '-#~0123456789%>.:'), 'top_go_next_row', SAME, 1))
+    rules.append(('top_go_next_row', '|', 'top_unmark_next_row', '#', 1))
+    rules.append(('top_unmark_next_row', SymbolClass('-0123456789'), 'top_unmark_next_row', SAME, 1))
+    rules.append(('top_unmark_next_row', '=', 'top_find_row', '~', 1))
+    
+    # The word goes right before the first row that is no smaller. A '^'
+    # cursor goes after the room opened for it, and the word is copied
+    # over one symbol at a time, each one turned to ' ' in the dictionary
+    # and given room with one more cell.
+    rules.append(('top_go_place', SymbolClass(string.ascii_lowercase + '-#~0123456789%>.:'), 'top_go_place', SAME, 1))
+    rules.append(('top_go_place', '|', 'top_unmark_place', '#', 1))
+    rules.append(('top_unmark_place', SymbolClass('-0123456789'), 'top_unmark_place', SAME, 1))
+    rules.append(('top_unmark_place', '=', 'top_go_place_start', '~', -1))
+    rules.append(('top_go_place_start', SymbolClass(string.ascii_lowercase + '-#0123456789'), 'top_go_place_start', SAME, -1))
+    rules.append(('top_go_place_start', SymbolClass('~>.:'), 'top_mark_place', SAME, 1))
+    rules.append(('top_mark_place', '-', 'top_open_place', '&', 1))
+    
+    row_symbols = string.ascii_lowercase + '-#~0123456789.:|='
+    rules += getShiftRules('top_open_place', row_symbols, {'&': ('_', 'top_place_cursor')})
+    rules.append(('top_place_cursor', SymbolClass(row_symbols + '+'), 'top_restore_row', '^', 1))
+    rules.append(('top_restore_row', SymbolClass(row_symbols + '+'), 'top_go_copy', '-', -1))
+    
+    rules.append(('top_open_end', '=', 'top_open_end_register', '^', 1))
+    rules.append(('top_open_end_register', '+', 'top_open_end_cap', '|', 1))
+    rules.append(('top_open_end_cap', '+', 'top_go_copy', '=', -1))
+    
+    rules.append(('top_go_copy', SymbolClass(row_symbols + '>^_'), 'top_go_copy', SAME, -1))
+    rules.append(('top_go_copy', '%', 'top_go_copy_start', '%', -1))
+    rules.append(('top_go_copy_start', SymbolClass(string.ascii_letters + '-'), 'top_go_copy_start', SAME, -1))
+    rules.append(('top_go_copy_start', SymbolClass('~$ '), 'top_copy', SAME, 1))
+    
+    for copy_symbol in string.ascii_lowercase + '-#~0123456789':
+        rules.append(('top_copy', copy_symbol, 'top_carry_' + copy_symbol, ' ', 1))
+        rules.append(('top_carry_' + copy_symbol, SymbolClass(string.ascii_letters + '-#~0123456789%>.:|=^'), 'top_carry_' + copy_symbol, SAME, 1))
+        if copy_symbol == '~':
+            rules.append(('top_carry_' + copy_symbol, '_', 'top_drop_cursor', copy_symbol, 1))
+        else:
+            rules.append(('top_carry_' + copy_symbol, '_', 'top_pass_cursor', copy_symbol, 1))
+    for letter in string.ascii_uppercase:
+        rules.append(('top_copy', letter, 'top_carry_' + letter.lower(), ' ', 1))
+    rules.append(('top_copy', '%', 'top_carry_#', ' ', 1))
+    
+    rules.append(('top_pass_cursor', '^', 'top_open_copy', '^', 1))
+    rules += getShiftRules('top_open_copy', row_symbols, {'^': ('_', 'top_copy_cursor')}, width=1)
+    rules.append(('top_copy_cursor', SymbolClass(row_symbols + '+'), 'top_copy_return', '^', -1))
+    rules.append(('top_copy_return', SymbolClass(string.ascii_letters + '-#~0123456789%>.:|=_'), 'top_copy_return', SAME, -1))
+    rules.append(('top_copy_return', ' ', 'top_copy', ' ', 1))
+    
+    # Once the region is full, its smallest row is kept as the register.
+    rules.append(('top_drop_cursor', '^', 'top_check_full', '.', -1))
+    rules.append(('top_check_full', SymbolClass(row_symbols), 'top_check_full', SAME, -1))
+    rules.append(('top_check_full', '>', 'top_find_free_row', '>', 1))
+    rules.append(('top_find_free_row', '.', 'top_find_free_row', '.', 1))
+    rules.append(('top_find_free_row', ':', 'top_go_next_word', ':', -1))
+    rules.append(('top_find_free_row', '-', 'top_mark_smallest', '-', 1))
+    rules.append(('top_mark_smallest', SymbolClass(string.ascii_lowercase + '-'), 'top_mark_smallest', SAME, 1))
+    rules.append(('top_mark_smallest', '#', 'top_mark_smallest_end', '|', 1))
+    rules.append(('top_mark_smallest_end', SymbolClass('-0123456789'), 'top_mark_smallest_end', SAME, 1))
+    rules.append(('top_mark_smallest_end', '~', 'top_go_next_word', '=', -1))
+    rules.append(('top_go_next_word', SymbolClass(region + '='), 'top_go_next_word', SAME, -1))
+    rules.append(('top_go_next_word', ' ', 'top_scan', ' ', 1))
+    
+    # With the dictionary done, the rows are written out from the largest
+    # down after the region, each symbol of a row turned to '.' once used
+    # and the one being carried marked '_'. Leading zeros are left out.
+    rules.append(('top_scan', '>', 'top_unmark_smallest', '>', 1))
+    rules.append(('top_unmark_smallest', SymbolClass(string.ascii_lowercase + '-#~0123456789.:'), 'top_unmark_smallest', SAME, 1))
+    rules.append(('top_unmark_smallest', '|', 'top_peek_end', '|', 1))
+    rules.append(('top_peek_end', '-', 'top_unmark_hash', '-', -1))
+    rules.append(('top_unmark_hash', '|', 'top_unmark_tild', '#', 1))
+    rules.append(('top_unmark_tild', SymbolClass('-0123456789'), 'top_unmark_tild', SAME, 1))
+    rules.append(('top_unmark_tild', '=', 'top_unmark_smallest', '~', 1))
+    rules.append(('top_peek_end', '=', 'top_find_largest', '=', -1))
+    
+    rules.append(('top_find_largest', SymbolClass('|.'), 'top_find_largest', SAME, -1))
+    rules.append(('top_find_largest', '~', 'top_go_largest_start', '~', -1))
+    rules.append(('top_go_largest_start', SymbolClass(string.ascii_lowercase + '-#0123456789'), 'top_go_largest_start', SAME, -1))
+    rules.append(('top_go_largest_start', SymbolClass('~>.:'), 'top_write_word', SAME, 1))
+    rules.append(('top_find_largest', SymbolClass(':>'), 'go_mark_mass_copy_start', SAME, -1))
+    
+    rules.append(('top_write_word', '-', 'top_write_word', '.', 1))
+    rules.append(('top_write_word', '#', 'top_write_spacer1', '_', 1))
+    rules.append(('top_write_lead', SymbolClass('-0'), 'top_write_lead', '.', 1))
+    rules.append(('top_write_count', '-', 'top_write_count', '.', 1))
+    rules.append(('top_write_count', '~', 'top_write_line_break', '.', 1))
+    
+    for write_symbol in string.ascii_lowercase + '0123456789':
+        if write_symbol in string.ascii_lowercase:
+            rules.append(('top_write_word', write_symbol, 'top_write_carry_' + write_symbol, '_', 1))
+            return_state = 'top_write_return_word'
+        else:
+            if write_symbol != '0':
+                rules.append(('top_write_lead', write_symbol, 'top_write_carry_' + write_symbol, '_', 1))
+            rules.append(('top_write_count', write_symbol, 'top_write_carry_' + write_symbol, '_', 1))
+            return_state = 'top_write_return_count'
+        rules.append(('top_write_carry_' + write_symbol, SymbolClass(string.ascii_lowercase + ' -#~0123456789.:|=\n'), 'top_write_carry_' + write_symbol, SAME, 1))
+        rules.append(('top_write_carry_' + write_symbol, '+', return_state, write_symbol, -1))
+        
+    for mode in ('word', 'lead', 'count'):
+        rules.append(('top_write_return_' + mode, SymbolClass(string.ascii_lowercase + ' -#~0123456789.:|=\n'), 'top_write_return_' + mode, SAME, -1))
+        rules.append(('top_write_return_' + mode, '_', 'top_write_' + mode, '.', 1))
+        
+    rules.append(('top_write_spacer1', SymbolClass(string.ascii_lowercase + ' -#~0123456789.:|=\n'), 'top_write_spacer1', SAME, 1))
+    rules.append(('top_write_spacer1', '+', 'top_write_spacer2', ' ', 1))
+    rules.append(('top_write_spacer2', '+', 'top_write_spacer3', '-', 1))
+    rules.append(('top_write_spacer3', '+', 'top_write_return_lead', ' ', -1))
+    
+    rules.append(('top_write_line_break', SymbolClass(string.ascii_lowercase + ' -#~0123456789.:|=\n'), 'top_write_line_break', SAME, 1))
+    rules.append(('top_write_line_break', '+', 'top_go_largest', '\n', -1))
+    rules.append(('top_go_largest', SymbolClass(string.ascii_lowercase + ' -0123456789=\n'), 'top_go_largest', SAME, -1))
+    rules.append(('top_go_largest', '|', 'top_find_largest', '|', -1))
+    
+    # Finally the rows are moved to the start of the tape.
+    rules.append(('go_mark_mass_copy_start', SymbolClass(string.ascii_lowercase + '$ -~0123456789#>.:'), 'go_mark_mass_copy_start', SAME, -1))
+    rules.append(('go_mark_mass_copy_start', '+', 'erase_first_space', '+', 1))
+    rules.append(('erase_first_space', ' ', 'mark_mass_copy_start', '+', 1))
+    
+    rules.append(('mark_mass_copy_start', SymbolClass(string.ascii_lowercase + '$ -~0123456789#>.:|'), 'go_find_mass_copy', '*', 1))
+    rules.append(('go_find_mass_copy', SymbolClass(string.ascii_lowercase + '$ -~0123456789#>.:|'), 'go_find_mass_copy', SAME, 1))
+    rules.append(('go_find_mass_copy', '=', 'go_mass_copy', '=', 1))
+    rules.append(('go_mass_copy', '=', 'go_mass_copy', '=', 1))
+    
+    for copy_letter in string.ascii_lowercase + ' -0123456789\n':
+        rules.append(('go_mass_copy', copy_letter, 'go_place_mass_letter_' + copy_letter, '=', -1))
+        rules.append(('go_place_mass_letter_' + copy_letter, SymbolClass(string.ascii_lowercase + '$ -~0123456789#>.:|='), 'go_place_mass_letter_' + copy_letter, SAME, -1))
+        rules.append(('go_place_mass_letter_' + copy_letter, '*', 'mark_mass_copy_start', copy_letter, 1))
+        
+    rules.append(('go_mass_copy', '+', 'clear_end', '+', -1))
+    rules.append(('clear_end', SymbolClass(string.ascii_lowercase + '$ -~0123456789#>.:|='), 'clear_end', '+', -1))
+    rules.append(('clear_end', '*', 'clear_end2', '+', -1))
+    rules.append(('clear_end2', '\n', 'find_beginning', '+', -1))
+    rules.append(('clear_end2', '+', 'DONE', '+', 1))
+    rules.append(('find_beginning', SymbolClass(string.ascii_lowercase + ' -0123456789\n'), 'find_beginning', SAME, -1))
+    rules.append(('find_beginning', '+', 'DONE', '+', 1))
+    
+    return rules
+        
+
+def generateMultiTapeRules(stop_words, charset=INPUT_ALPHABET, top=25):
+    '''
+    Returns the rules of the word frequency machine for
+    MultiTapeTuringMachine, on three tapes: the text on the first, the
+    dictionary on the second, and the max register and output on the
+    third. Each compared letter moves both heads by one cell, however far
+    apart the text and the dictionary are.
+    
+    The text is not scrubbed; capitals read as small letters and every
+    other symbol as a space. Dictionary entries are 'word#count~', with
+    '%' in place of '#' for stop words, found when the word is first
+    copied, and for words already printed. The register is written
+    leftwards from the '=' that the output starts at, so that it can grow
+    without running into anything. The spent text tape holds the countdown
+    of the <top> rows.
+    '''
+    if top < 1:
+        raise Exception('top must be at least 1, not {!r}'.format(top))
+    
+    #############
+    ### RULES #######################################################
+    #################################################################
+    # Curr. | Read      | New   | Write       | Move  
+    # State | Values    | State | Values      | Dists.
+    #-------|-----------|-------|-------------|--------
+
+    rules = []
+    
+    digits = '0123456789'
+    letters = string.ascii_lowercase
+    separator = SymbolClass(charset.difference(string.ascii_letters).union('+'))
+    text = SymbolClass(charset.union('+'))
+    entry = SymbolClass(letters + '#%' + digits)
+    dictionary = SymbolClass(letters + '$#%~+' + digits)
+    countdown = SymbolClass('|+')
+    
+    
+    ########################
+    ### \/ Word count \/
+    
+    
+    rules.append(('start', (text, '+', '+'), 'find_word', (SAME, '$', SAME), (0, 1, 0)))
+    
+    rules.append(('find_word', (separator, dictionary, '+'), 'find_word', (SAME, SAME, SAME), (1, 0, 0)))
+    rules.append(('find_word', ('+', dictionary, '+'), 'counted', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    # Comparing a word with an entry moves both heads along together. On a
+    # mismatch the text head goes back to the start of the word while the
+    # dictionary head goes on to the next entry.
+    for letter in letters:
+        letter_class = SymbolClass(letter + letter.upper())
+        rules.append(('find_word', (letter_class, dictionary, '+'), 'compare', (SAME, SAME, SAME), (0, 0, 0)))
+        rules.append(('compare', (letter_class, entry, '+'), 'rewind_skip', (SAME, SAME, SAME), (-1, 1, 0)))
+        rules.append(('compare', (letter_class, letter, '+'), 'compare', (SAME, SAME, SAME), (1, 1, 0)))
+    rules.append(('compare', (separator, entry, '+'), 'rewind_skip', (SAME, SAME, SAME), (-1, 1, 0)))
+    rules.append(('compare', (separator, '#', '+'), 'go_count', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('compare', (separator, '%', '+'), 'rewind_dictionary', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('compare', (text, '+', '+'), 'copy_stop_', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    rules.append(('rewind_skip', (text, entry, '+'), 'rewind_skip', (SAME, SAME, SAME), (-1, 1, 0)))
+    rules.append(('rewind_skip', (text, '~', '+'), 'rewind', (SAME, SAME, SAME), (-1, 1, 0)))
+    rules.append(('rewind_skip', (separator, entry, '+'), 'skip', (SAME, SAME, SAME), (1, 1, 0)))
+    rules.append(('rewind_skip', (separator, '~', '+'), 'compare', (SAME, SAME, SAME), (1, 1, 0)))
+    rules.append(('rewind', (text, dictionary, '+'), 'rewind', (SAME, SAME, SAME), (-1, 0, 0)))
+    rules.append(('rewind', (separator, dictionary, '+'), 'compare', (SAME, SAME, SAME), (1, 0, 0)))
+    rules.append(('skip', (text, entry, '+'), 'skip', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('skip', (text, '~', '+'), 'compare', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    rules.append(('go_count', (separator, SymbolClass(digits), '+'), 'go_count', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('go_count', (separator, '~', '+'), 'count', (SAME, SAME, SAME), (0, -1, 0)))
+    for digit in digits[:-1]:
+        rules.append(('count', (separator, digit, '+'), 'rewind_dictionary', (SAME, str(int(digit) + 1), SAME), (0, -1, 0)))
+    rules.append(('count', (separator, '9', '+'), 'count', (SAME, '0', SAME), (0, -1, 0)))
+    rules.append(('count', (separator, '#', '+'), 'carry_1', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    # A counter that runs out of digits takes a new leading one, carrying
+    # the rest of the dictionary one cell to the right.
+    for carried in digits + letters + '#%~':
+        for symbol in digits + letters + '#%~':
+            rules.append(('carry_' + carried, (separator, symbol, '+'), 'carry_' + symbol, (SAME, carried, SAME), (0, 1, 0)))
+        rules.append(('carry_' + carried, (separator, '+', '+'), 'rewind_dictionary', (SAME, carried, SAME), (0, -1, 0)))
+    
+    rules.append(('rewind_dictionary', (separator, dictionary, '+'), 'rewind_dictionary', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_dictionary', (separator, '$', '+'), 'find_word', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    # New words are copied to the end of the dictionary while walking the
+    # tree of stop words, so they are told apart once, not on every count.
+    prefixes = set(word[:length] for word in stop_words for length in xrange(len(word) + 1))
+    for prefix in prefixes:
+        for letter in letters:
+            new_state = 'copy_stop_' + prefix + letter if prefix + letter in prefixes else 'copy_word'
+            rules.append(('copy_stop_' + prefix, (SymbolClass(letter + letter.upper()), '+', '+'), new_state, (SAME, letter, SAME), (1, 1, 0)))
+        rules.append(('copy_stop_' + prefix, (separator, '+', '+'), 'close_stop_word' if prefix in stop_words else 'close_word', (SAME, SAME, SAME), (0, 0, 0)))
+    for letter in letters:
+        rules.append(('copy_word', (SymbolClass(letter + letter.upper()), '+', '+'), 'copy_word', (SAME, letter, SAME), (1, 1, 0)))
+    rules.append(('copy_word', (separator, '+', '+'), 'close_word', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    rules.append(('close_stop_word', (separator, '+', '+'), 'close_entry', (SAME, '%', SAME), (0, 1, 0)))
+    rules.append(('close_word', (separator, '+', '+'), 'place_count', (SAME, '#', SAME), (0, 1, 0)))
+    rules.append(('place_count', (separator, '+', '+'), 'close_entry', (SAME, '1', SAME), (0, 1, 0)))
+    rules.append(('close_entry', (separator, '+', '+'), 'rewind_dictionary', (SAME, '~', SAME), (0, -1, 0)))
+    
+    
+    ########################
+    ### \/ Highest N \/
+    
+    
+    # The countdown is kept clear of the text by a blank, since '|' can be
+    # in the text too, and the output starts right of the '='.
+    rules.append(('counted', ('+', dictionary, '+'), 'place_register', (SAME, SAME, SAME), (1, 0, -1)))
+    rules.append(('place_register', ('+', dictionary, '+'), 'place_countdown_0', (SAME, SAME, '='), (0, 0, 0)))
+    for row in xrange(top):
+        rules.append(('place_countdown_' + str(row), ('+', dictionary, '='), 'place_countdown_' + str(row + 1), ('|', SAME, SAME), (1, 0, 0)))
+    rules.append(('place_countdown_' + str(top), ('+', dictionary, '='), 'next_row', (SAME, SAME, SAME), (-1, 0, 0)))
+    
+    rules.append(('next_row', ('+', dictionary, '='), 'finish', (SAME, SAME, SAME), (0, 0, 0)))
+    rules.append(('next_row', ('|', dictionary, '='), 'rewind_max', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    rules.append(('rewind_max', ('|', dictionary, '='), 'rewind_max', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_max', ('|', '$', '='), 'scan_max', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    # First pass: the largest counter goes into the register.
+    rules.append(('scan_max', ('|', SymbolClass(letters), '='), 'scan_max', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('scan_max', ('|', '%', '='), 'skip_max', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('scan_max', ('|', '#', '='), 'compare_max_E', (SAME, SAME, SAME), (0, 1, -1)))
+    rules.append(('scan_max', ('|', '+', '='), 'found_max', (SAME, SAME, SAME), (0, 0, -1)))
+    rules.append(('skip_max', ('|', entry, '='), 'skip_max', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('skip_max', ('|', '~', '='), 'scan_max', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    # Counters are compared from their leading digits, the first differing
+    # digit deciding unless one counter turns out to be longer.
+    for result in 'EGL':
+        for digit in digits:
+            for register_digit in digits:
+                new_result = result if result != 'E' or digit == register_digit else ('G' if digit > register_digit else 'L')
+                rules.append(('compare_max_' + result, ('|', digit, register_digit), 'compare_max_' + new_result, (SAME, SAME, SAME), (0, 1, -1)))
+            rules.append(('compare_max_' + result, ('|', digit, '+'), 'rewind_copy_max', (SAME, SAME, SAME), (0, 0, 1)))
+        rules.append(('compare_max_' + result, ('|', '~', SymbolClass(digits)), 'return_max', (SAME, SAME, SAME), (0, 0, 1)))
+        rules.append(('compare_max_' + result, ('|', '~', '+'), 'rewind_copy_max' if result == 'G' else 'return_max', (SAME, SAME, SAME), (0, 0, 1)))
+        
+    rules.append(('return_max', ('|', dictionary, SymbolClass(digits + '+')), 'return_max', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('return_max', ('|', dictionary, '='), 'skip_max', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    rules.append(('rewind_copy_max', ('|', dictionary, SymbolClass(digits + '+')), 'rewind_copy_max', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('rewind_copy_max', ('|', SymbolClass(digits + '~'), '='), 'rewind_copy_max', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_copy_max', ('|', '#', '='), 'copy_max', (SAME, SAME, SAME), (0, 1, -1)))
+    for digit in digits:
+        rules.append(('copy_max', ('|', digit, SymbolClass(digits + '+')), 'copy_max', (SAME, SAME, digit), (0, 1, -1)))
+    rules.append(('copy_max', ('|', '~', SymbolClass(digits)), 'copy_max', (SAME, SAME, '+'), (0, 0, -1)))
+    rules.append(('copy_max', ('|', '~', '+'), 'return_max', (SAME, SAME, SAME), (0, 0, 1)))
+    
+    # Second pass: the first entry whose counter equals the register is
+    # printed and closed with '%'.
+    rules.append(('found_max', ('|', '+', '+'), 'finish', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('found_max', ('|', '+', SymbolClass(digits)), 'rewind_equal', (SAME, SAME, SAME), (0, -1, 1)))
+    rules.append(('rewind_equal', ('|', dictionary, '='), 'rewind_equal', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_equal', ('|', '$', '='), 'scan_equal', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    rules.append(('scan_equal', ('|', SymbolClass(letters), '='), 'scan_equal', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('scan_equal', ('|', '%', '='), 'skip_equal', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('scan_equal', ('|', '#', '='), 'compare_equal', (SAME, SAME, SAME), (0, 1, -1)))
+    rules.append(('skip_equal', ('|', entry, '='), 'skip_equal', (SAME, SAME, SAME), (0, 1, 0)))
+    rules.append(('skip_equal', ('|', '~', '='), 'scan_equal', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    rules.append(('compare_equal', ('|', SymbolClass(digits + '~'), SymbolClass(digits + '+')), 'return_equal', (SAME, SAME, SAME), (0, 0, 1)))
+    for digit in digits:
+        rules.append(('compare_equal', ('|', digit, digit), 'compare_equal', (SAME, SAME, SAME), (0, 1, -1)))
+    rules.append(('compare_equal', ('|', '~', '+'), 'rewind_print', (SAME, SAME, SAME), (0, -1, 1)))
+    
+    rules.append(('return_equal', ('|', dictionary, SymbolClass(digits + '+')), 'return_equal', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('return_equal', ('|', dictionary, '='), 'skip_equal', (SAME, SAME, SAME), (0, 0, 0)))
+    
+    rules.append(('rewind_print', ('|', SymbolClass(digits), SymbolClass(digits + '=')), 'rewind_print', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_print', ('|', '#', SymbolClass(digits + '=')), 'rewind_print', (SAME, '%', SAME), (0, -1, 0)))
+    rules.append(('rewind_print', ('|', SymbolClass(letters), SymbolClass(digits + '=')), 'rewind_print', (SAME, SAME, SAME), (0, -1, 0)))
+    rules.append(('rewind_print', ('|', SymbolClass('~$'), SymbolClass(digits + '=')), 'go_print', (SAME, SAME, SAME), (0, 1, 0)))
+    
+    rules.append(('go_print', ('|', SymbolClass(letters), SymbolClass(digits + string.ascii_lowercase + ' -=\n')), 'go_print', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('go_print', ('|', SymbolClass(letters), '+'), 'print_word', (SAME, SAME, SAME), (0, 0, 0)))
+    rules.append(('print_word', ('|', '%', '+'), 'print_dash', (SAME, SAME, ' '), (0, 1, 1)))
+    for letter in letters:
+        rules.append(('print_word', ('|', letter, '+'), 'print_word', (SAME, SAME, letter), (0, 1, 1)))
+    rules.append(('print_dash', ('|', SymbolClass(digits), '+'), 'print_space', (SAME, SAME, '-'), (0, 0, 1)))
+    rules.append(('print_space', ('|', SymbolClass(digits), '+'), 'print_count', (SAME, SAME, ' '), (0, 0, 1)))
+    for digit in digits:
+        rules.append(('print_count', ('|', digit, '+'), 'print_count', (SAME, SAME, digit), (0, 1, 1)))
+    rules.append(('print_count', ('|', '~', '+'), 'go_clear_register', (SAME, SAME, '\n'), (0, 0, -1)))
+    
+    rules.append(('go_clear_register', ('|', '~', SymbolClass(string.ascii_lowercase + digits + ' -\n')), 'go_clear_register', (SAME, SAME, SAME), (0, 0, -1)))
+    rules.append(('go_clear_register', ('|', '~', '='), 'clear_register', (SAME, SAME, SAME), (0, 0, -1)))
+    rules.append(('clear_register', ('|', '~', SymbolClass(digits)), 'clear_register', (SAME, SAME, '+'), (0, 0, -1)))
+    rules.append(('clear_register', ('|', '~', '+'), 'return_register', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('return_register', ('|', '~', '+'), 'return_register', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('return_register', ('|', '~', '='), 'next_row', ('+', SAME, SAME), (-1, 0, 0)))
+    
+    rules.append(('finish', (countdown, dictionary, SymbolClass(string.ascii_lowercase + digits + ' -=\n')), 'finish', (SAME, SAME, SAME), (0, 0, 1)))
+    rules.append(('finish', (countdown, dictionary, '+'), 'clear_end', (SAME, SAME, SAME), (0, 0, -1)))
+    rules.append(('clear_end', (countdown, dictionary, '\n'), 'find_beginning', (SAME, SAME, '+'), (0, 0, -1)))
+    rules.append(('clear_end', (countdown, dictionary, '='), 'find_beginning', (SAME, SAME, SAME), (0, 0, 0)))
+    rules.append(('find_beginning', (countdown, dictionary, SymbolClass(string.ascii_lowercase + digits + ' -\n')), 'find_beginning', (SAME, SAME, SAME), (0, 0, -1)))
+    rules.append(('find_beginning', (countdown, dictionary, '='), 'DONE', (SAME, SAME, '+'), (0, 0, 1)))
+    
+    return rules
+        
+
+STOP_WORDS = ['a', 'able', 'about', 'across', 'after', 'all', 'almost',
+              'also', 'am', 'among', 'an', 'and', 'any', 'are', 'as',
+              'at', 'be', 'because', 'been', 'but', 'by', 'can', 'cannot',
+              'could', 'dear', 'did', 'do', 'does', 'either', 'else',
+              'ever', 'every', 'for', 'from', 'get', 'got', 'had', 'has',
+              'have', 'he', 'her', 'hers', 'him', 'his', 'how', 'however',
+              'i', 'if', 'in', 'into', 'is', 'it', 'its', 'just', 'least',
+              'let', 'like', 'likely', 'may', 'me', 'might', 'most',
+              'must', 'my', 'neither', 'no', 'nor', 'not', 'of', 'off',
+              'often', 'on', 'only', 'or', 'other', 'our', 'own', 'rather',
+              'said', 'say', 'says', 'she', 'should', 'since', 'so',
+              'some', 'than', 'that', 'the', 'their', 'them', 'then',
+              'there', 'these', 'they', 'this', 'tis', 'to', 'too', 'twas',
+              'us', 'wants', 'was', 'we', 'were', 'what', 'when', 'where',
+              'which', 'while', 'who', 'whom', 'why', 'will', 'with',
+              'would', 'yet', 'you', 'your']
+
+STOP_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stop_words.txt')
+
+
+def readStopWords(path=STOP_WORDS_FILE):
+    '''
+    Returns the comma-separated stop words in the file at <path>, lowered,
+    or STOP_WORDS if the file is missing or holds none.
+    '''
+    if not os.path.exists(path):
+        return STOP_WORDS
+    stop_words = [word.strip().lower() for word in open(path).read().split(',')]
+    return [word for word in stop_words if word] or STOP_WORDS
+
+
+CHECKPOINT_FORMAT = 1
+
+
+def getFingerprint(tm, start_tape):
+    '''
+    Returns a hash of the compiled rules of <tm> and its <start_tape>, so
+    a checkpoint is only resumed on the run that wrote it.
+    '''
+    fingerprint = sha1(str(CHECKPOINT_FORMAT))
+    fingerprint.update(tm.compiled.dumps())
+    fingerprint.update(start_tape)
+    return fingerprint.hexdigest()
+    
+    
+def saveCheckpoint(tm, path, fingerprint):
+    '''
+    Writes <tm> to the checkpoint file at <path>, atomically, so a crash
+    while writing leaves the last checkpoint as it was.
+    '''
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    open(temp_path, 'wb').write(marshal.dumps((CHECKPOINT_FORMAT, fingerprint, tm.dumps())))
+    os.rename(temp_path, path)
+    
+    
+def loadCheckpoint(tm, path, fingerprint):
+    '''
+    Puts <tm> back where the checkpoint at <path> left it.
+    '''
+    version, saved_fingerprint, data = marshal.loads(open(path, 'rb').read())
+    if version != CHECKPOINT_FORMAT:
+        raise Exception('checkpoint format {}, expected {}'.format(version, CHECKPOINT_FORMAT))
+    if saved_fingerprint != fingerprint:
+        raise Exception('checkpoint {} was written for other rules or input'.format(path))
+    tm.loads(data)
+    
+    
+# Steps run between looks at the clock, the budget and the caller.
+SLICE_STEPS = 1000000
+
+Progress = namedtuple('Progress', ['steps', 'state', 'phase', 'tape_cells', 'seconds', 'halt'])
+
+
+def getTapeCells(tm):
+    '''
+    Returns how many cells of tape <tm> is holding on to, of any engine.
+    '''
+    if isinstance(tm, MultiTapeTuringMachine):
+        return sum(len(tape) for tape in tm.tapes)
+    if isinstance(tm, TuringMachine):
+        return tm.start_length + len(tm.tape)
+    return len(tm.tape)
+    
+    
+def runSliced(tm, slice_steps=SLICE_STEPS, max_steps=None, timeout=None):
+    '''
+    Runs <tm> <slice_steps> steps at a time, yielding a Progress after
+    every slice, until it halts, has run <max_steps> more steps, or has
+    run for <timeout> seconds, the clock being looked at between slices.
+    
+    The phase is the one getPhase() gives, or None for a multitape
+    machine, whose states aren't those of PHASES.
+    
+    Nothing runs while the caller holds on to the generator, so any
+    number of machines can take turns on one thread, or each slice can
+    be handed to an executor. A caller that stops asking cancels the run.
+    Whichever way it stops, <tm> is left where it got to, to run on or be
+    checkpointed; tm.halt tells whether it finished.
+    
+    >>> rules = [('A', '0', 'A', '1', 1), ('A', '1', 'B', '0', -1)]
+    >>> tm = CompiledTuringMachine(rules, start_state='A', start_tape='0001')
+    >>> [(progress.steps, progress.state, progress.halt) for progress in runSliced(tm, 2, max_steps=3)]
+    [(2, 'A', False), (3, 'A', False)]
+    >>> [(progress.steps, progress.state, progress.halt) for progress in runSliced(tm, 2)]
+    [(5, 'B', True)]
+    
+    '''
+    epoch = time()
+    limit = None if max_steps is None else tm.steps + max_steps
+    while not tm.halt:
+        if limit is None:
+            tm.run(slice_steps)
+        elif tm.steps < limit:
+            tm.run(min(slice_steps, limit - tm.steps))
+        else:
+            return
+        phase = None if isinstance(tm, MultiTapeTuringMachine) else getPhase(tm.state)
+        yield Progress(tm.steps, tm.state, phase, getTapeCells(tm), time() - epoch, tm.halt)
+        if timeout is not None and not tm.halt and time() - epoch >= timeout:
+            return
+            
+            
+def runCheckpointed(tm, path, fingerprint, every_steps=None, every_seconds=60, chunk=SLICE_STEPS, max_steps=None, timeout=None, progress=None):
+    '''
+    Runs <tm> as runSliced(tm, chunk, max_steps, timeout) does, passing
+    each Progress to <progress> if given, and saves a checkpoint to
+    <path> every <every_steps> steps or <every_seconds> seconds, whichever
+    comes first, and once more if it stops short of halting.
+    '''
+    last_steps = tm.steps
+    last_time = time()
+    for update in runSliced(tm, chunk if every_steps is None else min(chunk, every_steps), max_steps, timeout):
+        if progress is not None:
+            progress(update)
+        if tm.halt:
+            break
+        if ((every_steps is not None and tm.steps - last_steps >= every_steps) or
+            (every_seconds is not None and time() - last_time >= every_seconds)):
+            saveCheckpoint(tm, path, fingerprint)
+            last_steps = tm.steps
+            last_time = time()
+    if not tm.halt and tm.steps != last_steps:
+        saveCheckpoint(tm, path, fingerprint)
+            
+            
+def readInput(path):
+    '''
+    Returns the file at <path> as a read-only memory map, which reads
+    like a string without being loaded up front, or '' if it's empty.
+    '''
+    input_file = open(path, 'rb')
+    try:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        input_file.close()
+        
+        
+def getStartTape(s, dictionary, layout='linear'):
+    '''
+    Returns the tape a machine starts on to count <s>, into <dictionary>
+    if it isn't None: the '$ ... >' region a count() returned.
+    '''
+    if s.find('+') != -1:
+        raise Exception("'+' in input")
+    if dictionary is None:
+        return s
+    if layout != 'linear':
+        raise Exception('only the linear layout can resume counting, not {}'.format(layout))
+    if not (dictionary.startswith('$') and dictionary.endswith('>')) or '+' in dictionary:
+        raise Exception('not a counted dictionary: {!r}'.format(dictionary[:40]))
+    return s[:] + '+' + dictionary
+
+
+DEBUGGER_HELP = '''Commands:
+  <enter> | N         step once, or N times, passing over breakpoints
+  c                   continue to the next breakpoint
+  b state PATTERN     break on entering a state matching PATTERN, like top_*
+  b read SYMBOL       break before reading SYMBOL (SPACE and \\n for those)
+  b step N            break on step N
+  b cells LOW HIGH    break on the head entering cells LOW to HIGH
+  d                   delete all breakpoints
+  l                   list breakpoints
+  w [RADIUS]          show RADIUS cells either side of the head
+  f | fin | finish    run to the end'''
+
+
+def runDebugger(debugger):
+    '''
+    Reads debugger commands from the user until they finish, printing
+    where the machine stopped after every command that runs it.
+    '''
+    tm = debugger.tm
+    print DEBUGGER_HELP
+    show = True
+    while not tm.halt:
+        if show:
+            print '--- Step {} ---\n{}\nState: {}\nIndex: {}'.format(tm.steps, debugger.window(), tm.state, tm.index)
+        words = raw_input('(tm) ').split()
+        show = words[:1] not in (['b'], ['d'], ['l'], ['w'])
+        try:
+            if words in (['finish'], ['fin'], ['f']):
+                return
+            elif not words or words[0].isdigit():
+                debugger.step(int(words[0]) if words else 1)
+            elif words == ['c']:
+                print 'Stopped: {}'.format(', '.join(debugger.cont()))
+            elif words[0] == 'b' and len(words) == 3 and words[1] == 'state':
+                debugger.break_state(words[2])
+            elif words[0] == 'b' and len(words) == 3 and words[1] == 'read':
+                debugger.break_read({'SPACE': ' ', '\\n': '\n'}.get(words[2], words[2]))
+            elif words[0] == 'b' and len(words) == 3 and words[1] == 'step':
+                debugger.break_step(int(words[2]))
+            elif words[0] == 'b' and len(words) == 4 and words[1] == 'cells':
+                debugger.break_cells(int(words[2]), int(words[3]))
+            elif words == ['d']:
+                debugger.clear()
+            elif words == ['l']:
+                print debugger
+            elif words[0] == 'w' and len(words) <= 2:
+                print debugger.window(*[int(word) for word in words[1:]])
+            else:
+                print DEBUGGER_HELP
+        except Exception as e:
+            print e
+            
+            
+def parse(s, verbose=False, save_rules_to_file=False, user_stepthrough=False, engine='compiled', macro_cache=None, rule_cache=RULE_CACHE_DIR, layout='linear', top=25,
+          stop_words=None, scrub_stop_words=True, dictionary=None, checkpoint=None, checkpoint_steps=None, checkpoint_seconds=60, resume=False,
+          profiler=None, optimize=False, progress=None, max_steps=None, timeout=None, trace=None):
+    '''
+    Counts the words of <s> and returns the top <top> as the machine
+    prints them.
+    
+    Given <progress>, <max_steps> or <timeout>, the machine is run by
+    runSliced(), <progress> being called with every Progress, and a run
+    cut short raises an Exception, after leaving a checkpoint to resume
+    from if <checkpoint> is given.
+    
+    Given a <trace> path, every step is recorded there by a Tracer.
+    
+    >>> text = 'Tigers want wants. The tigers, want? Lions want the wants of lions.'
+    >>> print parse(text, engine='reference')
+    want - 3
+    tigers - 2
+    lions - 2
+    
+    The bucketed layout breaks ties by first letter before first sighting:
+    
+    >>> print parse(text, engine='reference', layout='bucketed')
+    want - 3
+    lions - 2
+    tigers - 2
+    
+    >>> print parse(text, engine='multitape')
+    want - 3
+    tigers - 2
+    lions - 2
+    
+    >>> print parse(text, engine='reference', top=2)
+    want - 3
+    tigers - 2
+    
+    >>> print parse(text, engine='reference', scrub_stop_words=False)
+    want - 3
+    tigers - 2
+    lions - 2
+    
+    '''
+    
+    if engine == 'multitape' and dictionary is not None:
+        raise Exception('the multitape engine cannot resume counting')
+    if engine == 'multitape' and optimize:
+        raise Exception('the multitape rules cannot be optimized')
+    if engine == 'multitape' and layout != 'linear':
+        raise Exception('the multitape engine has no {} layout'.format(layout))
+    if engine == 'multitape' and not scrub_stop_words:
+        raise Exception('the multitape engine marks stop words in its dictionary, scrub_stop_words cannot be turned off')
+    if macro_cache is not None and engine != 'compiled':
+        raise Exception('only the compiled engine can use a macro cache, not {}'.format(engine))
+    if user_stepthrough and engine not in ('compiled', 'generated'):
+        raise Exception('only the compiled and generated engines can be debugged, not {}'.format(engine))
+    if checkpoint is not None and engine not in ('compiled', 'generated'):
+        raise Exception('only the compiled and generated engines can be checkpointed, not {}'.format(engine))
+    if profiler is not None and engine != 'compiled':
+        raise Exception('only the compiled engine can be profiled, not {}'.format(engine))
+    if trace is not None and engine != 'compiled':
+        raise Exception('only the compiled engine can be traced, not {}'.format(engine))
+    if trace is not None and profiler is not None:
+        raise Exception('a run cannot be profiled and traced at once')
+    if macro_cache is not None and profiler is not None:
+        raise Exception('a run cannot be profiled and use a macro cache at once')
+    if macro_cache is not None and trace is not None:
+        raise Exception('a run cannot be traced and use a macro cache at once')
+    start_tape = getStartTape(s, dictionary, layout)
+        
+    if stop_words is None:
+        stop_words = readStopWords()
+        
+    if verbose:
+        print '--------------------------\n'
+        
+    if engine == 'multitape':
+        rules = generateMultiTapeRules(stop_words, top=top)
+        if verbose:
+            print '{} rules generated.'.format(len(rules))
+    elif engine == 'reference' or rule_cache is None:
+        rules = generateRules(stop_words, layout=layout, top=top, scrub_stop_words=scrub_stop_words)
+        if verbose:
+            print '{} rules generated ({} when expanded).'.format(len(rules), len(expandRules(rules)))
+        if optimize:
+            rules, report = optimizeRules(rules, ['scrub'], ['DONE', 'COUNTED'])
+            if verbose:
+                print 'Rules optimized: {}'.format(formatOptimizeReport(report))
+            if engine == 'reference':
+                rules = rules.named_rules()
+    else:
+        rules = loadRules(stop_words, cache_dir=rule_cache, verbose=verbose, layout=layout, top=top, scrub_stop_words=scrub_stop_words, optimize=optimize)
+    
+    if save_rules_to_file:
+        if optimize:
+            saveRules(rules.named_rules() if isinstance(rules, CompiledRules) else rules)
+        else:
+            saveRules(generateRules(stop_words, layout=layout, top=top, scrub_stop_words=scrub_stop_words) if isinstance(rules, CompiledRules) else rules)
+        if verbose:
+            print 'Rules saved to file rules.txt.'
+        
+    
+    if engine == 'multitape':
+        tm = MultiTapeTuringMachine(rules, start_state='start', start_tape=start_tape, default_slot_value='+', tape_count=3)
+    elif macro_cache is not None or profiler is not None or trace is not None:
+        tm = ENGINES[engine](rules, start_state='scrub', start_tape=start_tape, default_slot_value='+', macro_cache=macro_cache, profiler=profiler,
+                             tracer=(Tracer(trace) if trace is not None else None))
+    else:
+        tm = ENGINES[engine](rules, start_state='scrub', start_tape=start_tape, default_slot_value='+', **getEngineOptions(engine, rule_cache))
+    
+    if checkpoint is not None:
+        fingerprint = getFingerprint(tm, start_tape)
+        if resume and os.path.exists(checkpoint):
+            loadCheckpoint(tm, checkpoint, fingerprint)
+            if verbose:
+                print 'Resumed from {} on step {}.'.format(checkpoint, tm.steps)
+        
+    if user_stepthrough:
+        runDebugger(Debugger(tm))
+        
+    epoch = time()
+    try:
+        if checkpoint is not None:
+            runCheckpointed(tm, checkpoint, fingerprint, checkpoint_steps, checkpoint_seconds, max_steps=max_steps, timeout=timeout, progress=progress)
+            if tm.halt and os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        elif progress is not None or max_steps is not None or timeout is not None:
+            for update in runSliced(tm, max_steps=max_steps, timeout=timeout):
+                if progress is not None:
+                    progress(update)
+        else:
+            tm.run()
+    finally:
+        if trace is not None:
+            tm.tracer.close()
+    elapsed = time() - epoch
+    
+    if not tm.halt:
+        raise Exception('stopped on step {} in state {} after {:.2f}s, before halting'.format(tm.steps, tm.state, elapsed))
+        
+    if verbose:
+        print
+        print 'Halted after {:.2f}s on step {}.'.format(elapsed, tm.steps)
+        print 'State: {}'.format(tm.state)
+        if engine == 'multitape':
+            print 'Read: {}'.format(tuple([tm.read(tape) for tape in xrange(len(tm.tapes))]))
+        else:
+            print 'Read: {}'.format(tm[tm.index])
+        if macro_cache is not None:
+            print macro_cache
+        if trace is not None:
+            print 'Trace of {} steps written to {} ({} bytes).'.format(tm.steps, trace, os.path.getsize(trace))
+        print '\nTape Printout:'
+        
+    if engine == 'multitape':
+        return tm.get_whole_printout(2)
+    return tm.get_whole_printout()
+
+
+def count(s, dictionary=None, verbose=False, engine='compiled', rule_cache=RULE_CACHE_DIR, stop_words=None, scrub_stop_words=True):
+    '''
+    Counts the words of <s> on a count_only machine, on into <dictionary>
+    if given, and returns the '$ ... >' dictionary it leaves on tape.
+    
+    Only the new text is run through, so counting a document as it grows
+    takes steps for what was added since, and parse('', dictionary=...)
+    then picks the top words out of the result.
+    
+    >>> dictionary = count('Tigers want wants.', engine='reference')
+    >>> dictionary
+    '$[t-i-g-e-r-s#-0-0-0-1~-w-a-n-t#-0-0-0-1~>'
+    >>> dictionary = count('The tigers, want? Lions want the wants of lions.', dictionary, engine='reference')
+    >>> print parse('', engine='reference', dictionary=dictionary)
+    want - 3
+    tigers - 2
+    lions - 2
+    
+    '''
+    start_tape = getStartTape(s, dictionary)
+    if stop_words is None:
+        stop_words = readStopWords()
+    
+    if engine == 'reference' or rule_cache is None:
+        rules = generateRules(stop_words, count_only=True, scrub_stop_words=scrub_stop_words)
+    else:
+        rules = loadRules(stop_words, cache_dir=rule_cache, verbose=verbose, count_only=True, scrub_stop_words=scrub_stop_words)
+    tm = ENGINES[engine](rules, start_state='scrub', start_tape=start_tape, default_slot_value='+', **getEngineOptions(engine, rule_cache))
+    
+    epoch = time()
+    tm.run()
+    elapsed = time() - epoch
+    if tm.state != 'COUNTED':
+        raise Exception('count halted in state {} after {} steps'.format(tm.state, tm.steps))
+    if verbose:
+        print 'Counted in {:.2f}s on step {}.'.format(elapsed, tm.steps)
+        
+    printout = tm.get_whole_printout()
+    return printout[printout.index('$'):]
+
+
+# Set in each parse_many() worker process by initParseWorker().
+WORKER_RULES = None
+WORKER_OPTIONS = {}
+
+
+def initParseWorker(engine, rules_data, count_only=False, stop_words=STOP_WORDS, rule_cache=RULE_CACHE_DIR, top=25):
+    global WORKER_RULES, WORKER_OPTIONS
+    WORKER_OPTIONS = getEngineOptions(engine, rule_cache)
+    if engine == 'reference':
+        WORKER_RULES = generateRules(stop_words, count_only=count_only, top=top)
+    else:
+        WORKER_RULES = CompiledRules.loads(rules_data)
+
+
+def parseWorker(args):
+    path, engine = args
+    s = readInput(path)
+    if s.find('+') != -1:
+        raise Exception("'+' in input {}".format(path))
+    tm = ENGINES[engine](WORKER_RULES, start_state='scrub', start_tape=s, default_slot_value='+', **WORKER_OPTIONS)
+    epoch = time()
+    tm.run()
+    elapsed = time() - epoch
+    return path, tm.get_whole_printout(), tm.state, tm.steps, elapsed
+
+
+def parse_many(paths, workers=None, engine='compiled', rule_cache=RULE_CACHE_DIR, stop_words=None, top=25):
+    '''
+    Counts the <top> words of every file in <paths>, one machine per
+    document, on a pool of <workers> processes (one per CPU by default).
+    The rules are loaded once and handed to each worker.
+    
+    Yields (path, printout, final state, steps, elapsed seconds) for each
+    document as soon as it finishes, so not in the order of <paths>.
+    '''
+    if stop_words is None:
+        stop_words = readStopWords()
+    if engine == 'reference':
+        rules_data = None
+    elif rule_cache is None:
+        rules_data = CompiledRules.compile(generateRules(stop_words, top=top), '+').dumps()
+    else:
+        rules_data = loadRules(stop_words, cache_dir=rule_cache, top=top).dumps()
+    jobs = [(path, engine) for path in paths]
+    
+    if workers == 1:
+        initParseWorker(engine, rules_data, stop_words=stop_words, rule_cache=rule_cache, top=top)
+        for job in jobs:
+            yield parseWorker(job)
+        return
+        
+    pool = Pool(workers, initializer=initParseWorker, initargs=(engine, rules_data, False, stop_words, rule_cache, top))
+    try:
+        for result in pool.imap_unordered(parseWorker, jobs):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def readWordCounts(printout):
+    '''
+    Reads the dictionary a count_only machine leaves on tape back into a
+    list of (word, count), in the order the words were first seen.
+    
+    >>> readWordCounts(' eat  ate eat $-e-a-t#-0-0-0-2~-a-t-e#-0-0-0-1~>')
+    [('eat', 2), ('ate', 1)]
+    
+    '''
+    start = printout.index('$') + 1
+    end = printout.index('>', start)
+    counts = []
+    for entry in printout[start:end].split('~')[:-1]:
+        if not entry:
+            continue
+        word, number = entry.replace('@', '#').split('#')
+        counts.append((word.translate(None, '-['), int(number.translate(None, '-['))))
+    return counts
+    
+    
+def mergeWordCounts(count_lists):
+    '''
+    Adds up several readWordCounts() lists, keeping first-seen order.
+    
+    >>> mergeWordCounts([[('b', 1), ('a', 2)], [('a', 1), ('c', 1)]])
+    [('b', 1), ('a', 3), ('c', 1)]
+    
+    '''
+    merged = OrderedDict()
+    for counts in count_lists:
+        for word, count in counts:
+            merged[word] = merged.get(word, 0) + count
+    return merged.items()
+    
+    
+def formatTopWords(counts, stop_words, n=25):
+    '''
+    Formats the <n> most frequent words of <counts> that aren't stop words
+    the way the machine prints them, ties going to the word seen first.
+    
+    >>> print formatTopWords([('the', 9), ('b', 1), ('a', 2), ('c', 2)], ['the'], n=2)
+    a - 2
+    c - 2
+    
+    '''
+    counts = [(word, count) for word, count in counts if word not in stop_words]
+    ranked = sorted(enumerate(counts), key=lambda (order, (word, count)): (-count, order))
+    return '\n'.join('{} - {}'.format(word, count) for order, (word, count) in ranked[:n])
+    
+    
+def splitShards(s, shards):
+    '''
+    Splits <s> into about <shards> pieces of similar size, only ever
+    cutting at a character that isn't a letter, so no word is split.
+    
+    >>> splitShards('one two three four', 2)
+    ['one two three', ' four']
+    >>> splitShards('one two three four', 3)
+    ['one two', ' three', ' four']
+    
+    '''
+    pieces = []
+    start = 0
+    for shard in xrange(1, shards):
+        cut = max(start, len(s) * shard // shards)
+        while cut < len(s) and s[cut] in string.ascii_letters:
+            cut += 1
+        pieces.append(s[start:cut])
+        start = cut
+    pieces.append(s[start:])
+    return [piece for piece in pieces if piece]
+    
+    
+def countWorker(args):
+    s, engine = args
+    tm = ENGINES[engine](WORKER_RULES, start_state='scrub', start_tape=s, default_slot_value='+', **WORKER_OPTIONS)
+    epoch = time()
+    tm.run()
+    elapsed = time() - epoch
+    if tm.state != 'COUNTED':
+        raise Exception('shard halted in state {} after {} steps'.format(tm.state, tm.steps))
+    return readWordCounts(tm.get_whole_printout()), tm.steps, elapsed
+    
+    
+def parse_sharded(s, shards=None, workers=None, verbose=False, engine='compiled', rule_cache=RULE_CACHE_DIR, stop_words=None, top=25):
+    '''
+    Like parse(), but splits <s> into <shards> pieces (one per worker by
+    default) and runs a count_only machine on each in a pool of <workers>
+    processes. The dictionaries they leave on tape are merged, and the
+    stop words and <top> words are then worked out in Python.
+    '''
+    if '+' in s:
+        raise Exception("'+' in input")
+    if top < 1:
+        raise Exception('top must be at least 1, not {!r}'.format(top))
+    if shards is None:
+        shards = workers or cpu_count()
+    if stop_words is None:
+        stop_words = readStopWords()
+    
+    if engine == 'reference':
+        rules_data = None
+    elif rule_cache is None:
+        rules_data = CompiledRules.compile(generateRules(stop_words, count_only=True), '+').dumps()
+    else:
+        rules_data = loadRules(stop_words, cache_dir=rule_cache, count_only=True).dumps()
+    jobs = [(piece, engine) for piece in splitShards(s, shards)]
+    
+    epoch = time()
+    if workers == 1:
+        initParseWorker(engine, rules_data, count_only=True, stop_words=stop_words, rule_cache=rule_cache)
+        results = map(countWorker, jobs)
+    else:
+        pool = Pool(workers, initializer=initParseWorker, initargs=(engine, rules_data, True, stop_words, rule_cache))
+        try:
+            results = pool.map(countWorker, jobs)
+        finally:
+            pool.terminate()
+    elapsed = time() - epoch
+    
+    if verbose:
+        print '--------------------------\n'
+        for shard, (counts, steps, shard_elapsed) in enumerate(results):
+            print 'Shard {}: {} words counted in {:.2f}s on step {}.'.format(shard, len(counts), shard_elapsed, steps)
+        print '\n{} shards counted in {:.2f}s, {} steps in total.'.format(len(results), elapsed, sum(steps for counts, steps, shard_elapsed in results))
+        print '\nTop Words:'
+        
+    return formatTopWords(mergeWordCounts([counts for counts, steps, shard_elapsed in results]), stop_words, top)
+
+
+def main():
+    paths = [arg for arg in argv[1:] if not arg.startswith('-')]
+    workers = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-j') and len(arg) > 2]
+    shards = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-p') and len(arg) > 2]
+    tops = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-n') and len(arg) > 2]
+    dictionaries = [arg[2:] for arg in argv[1:] if arg.startswith('-d') and len(arg) > 2]
+    checkpoints = [arg[2:] for arg in argv[1:] if arg.startswith('-c') and len(arg) > 2]
+    profiles = [arg[2:] for arg in argv[1:] if arg.startswith('-f')]
+    traces = [arg[2:] for arg in argv[1:] if arg.startswith('-x') and len(arg) > 2]
+    if len(paths) < 1:
+        print 'Usage:\n$ python frequency.py <filename> [-v] [-s] [-u] [-r | -t | -g] [-m] [-b] [-nN] [-o] [-c<checkpoint> [-k]] [-f[<profile.json>]] [-x<trace>]'
+        print '$ python frequency.py <filename> [<filename> ...] [-jN] [-r | -g] [-nN]'
+        print '$ python frequency.py <filename> -pN [-jN] [-v] [-r | -g] [-nN]'
+        print '$ python frequency.py <filename> -d<dictionary> [-v] [-r | -g] [-nN]'
+    elif dictionaries:
+        # Count the file on into the saved dictionary, save it back, and
+        # print the top words of everything counted so far.
+        engine = 'reference' if '-r' in argv else 'generated' if '-g' in argv else 'compiled'
+        dictionary = open(dictionaries[0]).read() if os.path.exists(dictionaries[0]) else None
+        dictionary = count(readInput(paths[0]), dictionary, verbose=('-v' in argv), engine=engine)
+        temp_path = '{}.{}.tmp'.format(dictionaries[0], os.getpid())
+        open(temp_path, 'w').write(dictionary)
+        os.rename(temp_path, dictionaries[0])
+        print parse('', verbose=('-v' in argv), engine=engine, top=(tops[0] if tops else 25), dictionary=dictionary)
+        if ('-v' in argv):
+            print '\n--------------------------'
+    elif shards:
+        input_string = open(paths[0]).read()
+        print parse_sharded(input_string, shards=shards[0], workers=(workers[0] if workers else None), verbose=('-v' in argv),
+                            engine=('reference' if '-r' in argv else 'generated' if '-g' in argv else 'compiled'), top=(tops[0] if tops else 25))
+        if ('-v' in argv):
+            print '\n--------------------------'
+    elif len(paths) > 1 or workers:
+        engine = 'reference' if '-r' in argv else 'generated' if '-g' in argv else 'compiled'
+        for path, printout, state, steps, elapsed in parse_many(paths, workers=(workers[0] if workers else None), engine=engine,
+                                                                    top=(tops[0] if tops else 25)):
+            print '--- {}: {} steps in {:.2f}s ({}) ---'.format(path, steps, elapsed, state)
+            print printout
     else:
-        input_string = open(argv[1]).read()
-        print parse(input_string, verbose=('-v' in argv), save_rules_to_file=('-s' in argv), user_stepthrough=('-u' in argv))
+        input_string = readInput(paths[0])
+        engine = 'multitape' if '-t' in argv else 'reference' if '-r' in argv else 'generated' if '-g' in argv else 'compiled'
+        profiler = Profiler() if profiles else None
+        print parse(input_string, verbose=('-v' in argv), save_rules_to_file=('-s' in argv), user_stepthrough=('-u' in argv), engine=engine,
+                     macro_cache=(MacroCache() if '-m' in argv else None), layout=('bucketed' if '-b' in argv else 'linear'),
+                     top=(tops[0] if tops else 25), checkpoint=(checkpoints[0] if checkpoints else None), resume=('-k' in argv), profiler=profiler,
+                     optimize=('-o' in argv), trace=(traces[0] if traces else None))
+        if profiler is not None:
+            print '\n{!r}'.format(profiler)
+            if profiles[0]:
+                open(profiles[0], 'w').write(profiler.to_json())
         if ('-v' in argv):
             print '\n--------------------------'
     
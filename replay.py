@@ -0,0 +1,144 @@
+import array
+import marshal
+import zlib
+from sys import argv
+
+import frequency
+
+
+def readTrace(path):
+    '''
+    Returns the compiled rules of the trace at <path>, the machine as its
+    first traced step found it, and an iterator over its record blocks.
+    '''
+    trace_file = open(path, 'rb')
+    version, rules_data, machine_data = marshal.load(trace_file)
+    if version != frequency.TRACE_FORMAT:
+        raise Exception('trace format {}, expected {}'.format(version, frequency.TRACE_FORMAT))
+    
+    def blocks():
+        try:
+            while True:
+                try:
+                    data = marshal.load(trace_file)
+                except EOFError:
+                    return
+                yield array.array('i', zlib.decompress(data))
+        finally:
+            trace_file.close()
+    
+    return frequency.CompiledRules.loads(zlib.decompress(rules_data)), zlib.decompress(machine_data), blocks()
+
+
+def replayTrace(path, until=None, profiler=None):
+    '''
+    Replays the trace at <path> up to step <until>, or to its end, and
+    returns the machine as it was then, adding the steps, visits, travel
+    and cells reached of every state to <profiler> if given.
+    
+    Every record is checked against the tape as it's replayed, so a trace
+    that doesn't belong to its rules and start tape raises.
+    
+    >>> import os, tempfile
+    >>> rules = [('A', '0', 'A', '0', 1), ('A', '1', 'B', '1', -1), ('B', '0', 'B', '1', -1)]
+    >>> path = os.path.join(tempfile.mkdtemp(), 'trace')
+    >>> tracer = frequency.Tracer(path)
+    >>> tm = frequency.CompiledTuringMachine(rules, start_state='A', default_slot_value='+', start_tape='0001', tracer=tracer)
+    >>> tm.run()
+    >>> tracer.close()
+    >>> tm.steps, tm.get_whole_printout()
+    (8, '1111')
+    >>> replayed = replayTrace(path, until=5)
+    >>> replayed.steps, replayed.state, replayed.get_whole_printout()
+    (5, 'B', '0011')
+    >>> replayed = replayTrace(path)
+    >>> replayed.steps, replayed.halt, replayed.get_whole_printout()
+    (8, True, '1111')
+    
+    '''
+    compiled, machine_data, blocks = readTrace(path)
+    tm = frequency.CompiledTuringMachine(compiled, compiled.states[0], default_slot_value=compiled.symbols[0], sweeps=False)
+    tm.loads(machine_data)
+    
+    width = tm.width
+    rule_table = tm.rule_table
+    tape = tm.tape
+    row = tm.row
+    pos = tm.index + tm.offset
+    if not 0 <= pos < len(tape):
+        pos = tm.grow(pos)
+    steps = tm.steps
+    counts = [0] * len(tm.states)
+    visits = [0] * len(tm.states)
+    visits[row // width] += 1
+    travel = 0
+    lowest = highest = tm.index
+    
+    for records in blocks:
+        i = 0
+        while i < len(records) and not tm.halt and steps != until:
+            cell = records[i]
+            count = 1
+            if cell < 0:
+                cell = -1 - cell
+                count = records[i + 1]
+                i += 1
+            i += 1
+            if cell != row + tape[pos]:
+                raise Exception('trace does not match its rules and tape at step {}'.format(steps))
+            
+            if until is not None:
+                count = min(count, until - steps)
+            steps += count
+            counts[row // width] += count
+            rule = rule_table[cell]
+            if rule is None:
+                tm.halt = True
+                break
+            new_row, write_value, move_dist = rule
+            if count == 1:
+                tape[pos] = write_value
+            pos += count * move_dist
+            travel += count * abs(move_dist)
+            if not 0 <= pos < len(tape):
+                pos = tm.grow(pos)
+            lowest = min(lowest, pos - tm.offset)
+            highest = max(highest, pos - tm.offset)
+            if new_row != row:
+                row = new_row
+                visits[row // width] += 1
+        if tm.halt or steps == until:
+            break
+    
+    tm.row = row
+    tm.index = pos - tm.offset
+    tm.steps = steps
+    if profiler is not None:
+        profiler.add(tm.states, counts, visits, [0.0] * len(tm.states), travel, lowest, highest)
+    return tm
+
+
+def main():
+    paths = [arg for arg in argv[1:] if not arg.startswith('-')]
+    untils = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-s') and len(arg) > 2]
+    radii = [int(arg[2:]) for arg in argv[1:] if arg.startswith('-w') and len(arg) > 2]
+    profiles = [arg[2:] for arg in argv[1:] if arg.startswith('-f') and len(arg) > 2]
+    if len(paths) != 1:
+        print 'Usage:\n$ python replay.py <trace> [-sSTEP [-wRADIUS]] [-f<profile.json>]'
+        return
+    
+    profiler = frequency.Profiler()
+    tm = replayTrace(paths[0], until=(untils[0] if untils else None), profiler=profiler)
+    print profiler
+    if untils:
+        print '\n--- Step {} ---\n{}{}\nState: {}\nIndex: {}'.format(tm.steps, frequency.Debugger(tm).window(radii[0] if radii else 9),
+                                                                    ' HALT' if tm.halt else '', tm.state, tm.index)
+        print '\nTape Printout:\n{}'.format(tm.get_whole_printout())
+    if profiles:
+        open(profiles[0], 'w').write(profiler.to_json())
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
+    main()
+